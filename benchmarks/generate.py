@@ -0,0 +1,107 @@
+"""Reproducible synthetic file pairs for the benchmarks.
+
+    python benchmarks/generate.py OUT_DIR --lines 100000 --edit-density 0.01
+"""
+import argparse
+import os
+import random
+from typing import List, Tuple
+
+WORDS = (
+    "alpha beta gamma delta epsilon zeta theta kappa lambda sigma omega "
+    "return value index count buffer result config handler request parse "
+    "if else for while import class def self None True False"
+).split()
+
+
+def _make_line(rng: random.Random, line_length: int) -> str:
+    words = []
+    length = 0
+    while length < line_length:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)[:line_length]
+
+
+def generate_pair(lines: int = 10000, edit_density: float = 0.01, line_length: int = 60,
+                  move_blocks: int = 0, move_size: int = 20, whitespace_noise: float = 0.0,
+                  seed: int = 0) -> Tuple[List[str], List[str]]:
+    """Build (old, new) line lists; the same arguments always give the same pair.
+
+    edit_density is the fraction of lines hit by a random replace, insert or
+    delete. move_blocks blocks of move_size lines are cut and pasted elsewhere,
+    and whitespace_noise is the fraction of new lines whose spacing changes.
+    """
+    rng = random.Random(seed)
+    old = [_make_line(rng, line_length) for _ in range(lines)]
+    new = list(old)
+
+    for _ in range(int(lines * edit_density)):
+        pos = rng.randrange(len(new) + 1)
+        op = rng.choice(('replace', 'insert', 'delete'))
+        if op == 'insert' or pos == len(new):
+            new.insert(pos, _make_line(rng, line_length))
+        elif op == 'replace':
+            new[pos] = _make_line(rng, line_length)
+        else:
+            del new[pos]
+
+    for _ in range(move_blocks):
+        if len(new) <= move_size:
+            break
+        start = rng.randrange(len(new) - move_size)
+        block = new[start:start + move_size]
+        del new[start:start + move_size]
+        dest = rng.randrange(len(new) + 1)
+        new[dest:dest] = block
+
+    for pos in range(len(new)):
+        if rng.random() < whitespace_noise:
+            if rng.random() < 0.5:
+                new[pos] = new[pos].replace(" ", "  ", 1)
+            else:
+                new[pos] = new[pos] + "  "
+
+    return old, new
+
+
+def write_pair(directory: str, name: str = "pair", **params) -> Tuple[str, str]:
+    """Generate a pair and write it as NAME_old.txt / NAME_new.txt in directory"""
+    old, new = generate_pair(**params)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for suffix, lines in (("old", old), ("new", new)):
+        path = os.path.join(directory, f"{name}_{suffix}.txt")
+        with open(path, "w", encoding="utf-8", newline="\n") as f:
+            f.write("\n".join(lines))
+            f.write("\n")
+        paths.append(path)
+    return paths[0], paths[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic file pair for benchmarking")
+    parser.add_argument("out_dir", help="Directory to write NAME_old.txt and NAME_new.txt to")
+    parser.add_argument("--name", default="pair", help="File name prefix (default: pair)")
+    parser.add_argument("--lines", type=int, default=10000, help="Lines in the old file (default: 10000)")
+    parser.add_argument("--edit-density", type=float, default=0.01,
+                        help="Fraction of lines replaced, inserted or deleted (default: 0.01)")
+    parser.add_argument("--line-length", type=int, default=60, help="Characters per line (default: 60)")
+    parser.add_argument("--move-blocks", type=int, default=0, help="Blocks of lines moved elsewhere (default: 0)")
+    parser.add_argument("--move-size", type=int, default=20, help="Lines per moved block (default: 20)")
+    parser.add_argument("--whitespace-noise", type=float, default=0.0,
+                        help="Fraction of new lines with changed spacing (default: 0)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    args = parser.parse_args()
+
+    old_path, new_path = write_pair(
+        args.out_dir, args.name, lines=args.lines, edit_density=args.edit_density,
+        line_length=args.line_length, move_blocks=args.move_blocks, move_size=args.move_size,
+        whitespace_noise=args.whitespace_noise, seed=args.seed)
+    print(old_path)
+    print(new_path)
+
+
+if __name__ == "__main__":
+    main()
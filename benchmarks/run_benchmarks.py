@@ -0,0 +1,212 @@
+"""Time the engine, statistics, formatter and GUI rendering on synthetic pairs.
+
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --baseline results.json
+
+The GUI phase needs a display (use xvfb-run on a headless machine) and is
+skipped when Tk cannot start. Timings are the best of --repeat runs; peak
+memory comes from one extra run under tracemalloc.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Callable, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from diff_engine import ALGORITHMS, DEFAULT_ALGORITHM, ENGINE_VERSION, DiffEngine
+from generate import generate_pair
+
+# name -> (generate_pair arguments, DiffEngine arguments)
+SCENARIOS = {
+    'small': (dict(lines=1000, edit_density=0.05), {}),
+    'medium': (dict(lines=20000, edit_density=0.01), {}),
+    'large': (dict(lines=200000, edit_density=0.001), {}),
+    'dense': (dict(lines=20000, edit_density=0.2), {}),
+    'long-lines': (dict(lines=20000, edit_density=0.01, line_length=400), {}),
+    'moves': (dict(lines=20000, edit_density=0.005, move_blocks=20), {}),
+    'whitespace': (dict(lines=20000, edit_density=0.005, whitespace_noise=0.05),
+                   dict(ignore_whitespace=True)),
+}
+
+PHASES = ('diff_lines', 'compare_lines', 'get_stats', 'format_diff', 'display_diff')
+
+# Timings below this are noise and never reported as regressions
+MIN_COMPARABLE_SECONDS = 0.005
+
+
+def _time_best(func: Callable[[], object], repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _peak_memory(func: Callable[[], object]) -> int:
+    """Peak bytes allocated while func runs"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        func()
+        return tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+
+
+def _make_gui():
+    """A withdrawn DiffGUI, or None when Tk is unavailable"""
+    try:
+        import tkinter as tk
+        from gui import DiffGUI
+        root = tk.Tk()
+    except Exception:
+        return None
+    root.withdraw()
+    return DiffGUI(root)
+
+
+def run_scenario(name: str, algorithm: str, repeat: int, gui) -> dict:
+    pair_params, engine_params = SCENARIOS[name]
+    lines1, lines2 = generate_pair(**pair_params)
+    engine = DiffEngine(algorithm=algorithm, **engine_params)
+
+    from cli import SideBySideFormatter
+    formatter = SideBySideFormatter(use_color=True, width=120)
+
+    # Inputs for the later phases are computed once, outside the timings
+    result = engine.diff_lines(lines1, lines2)
+    left_diff, right_diff = engine.compare_lines(lines1, lines2)
+
+    phases = {
+        'diff_lines': lambda: engine.diff_lines(lines1, lines2),
+        'compare_lines': lambda: engine.compare_lines(lines1, lines2),
+        'get_stats': lambda: engine.get_stats(left_diff, right_diff),
+        'format_diff': lambda: formatter.format_diff(left_diff, right_diff, 'old.txt', 'new.txt'),
+    }
+    if gui is not None:
+        def display():
+            gui.display_diff(result, 'old.txt', 'new.txt')
+            gui.root.update_idletasks()
+        phases['display_diff'] = display
+
+    timings = {}
+    peak_memory = {}
+    for phase in PHASES:
+        func = phases.get(phase)
+        if func is None:
+            timings[phase] = peak_memory[phase] = None
+            continue
+        timings[phase] = _time_best(func, repeat)
+        peak_memory[phase] = _peak_memory(func)
+
+    return {
+        'scenario': name,
+        'params': dict(pair_params, **engine_params, algorithm=algorithm),
+        'lines': [len(lines1), len(lines2)],
+        'timings': timings,
+        'peak_memory': peak_memory,
+    }
+
+
+def compare_to_baseline(current: dict, baseline: dict, threshold: float) -> List[str]:
+    """Lines describing every phase that got slower than threshold x the baseline"""
+    previous = {(entry['scenario'], entry['params'].get('algorithm')): entry
+                for entry in baseline['results']}
+    regressions = []
+    for entry in current['results']:
+        old = previous.get((entry['scenario'], entry['params'].get('algorithm')))
+        if old is None:
+            continue
+        for phase, seconds in entry['timings'].items():
+            old_seconds = old['timings'].get(phase)
+            if seconds is None or old_seconds is None or old_seconds < MIN_COMPARABLE_SECONDS:
+                continue
+            if seconds > old_seconds * threshold:
+                regressions.append(f"{entry['scenario']}/{phase}: {old_seconds:.4f}s -> {seconds:.4f}s "
+                                   f"({seconds / old_seconds:.2f}x)")
+    return regressions
+
+
+def print_table(results: dict, baseline: Optional[dict]):
+    previous = {}
+    if baseline is not None:
+        previous = {(entry['scenario'], entry['params'].get('algorithm')): entry
+                    for entry in baseline['results']}
+    print(f"{'scenario':<12} {'phase':<14} {'seconds':>10} {'peak MB':>9} {'vs base':>8}")
+    for entry in results['results']:
+        old = previous.get((entry['scenario'], entry['params'].get('algorithm')))
+        for phase in PHASES:
+            seconds = entry['timings'][phase]
+            if seconds is None:
+                print(f"{entry['scenario']:<12} {phase:<14} {'skipped':>10}")
+                continue
+            peak = entry['peak_memory'][phase] / (1024 * 1024)
+            ratio = ""
+            if old is not None and old['timings'].get(phase):
+                ratio = f"{seconds / old['timings'][phase]:.2f}x"
+            print(f"{entry['scenario']:<12} {phase:<14} {seconds:>10.4f} {peak:>9.1f} {ratio:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the diff engine, formatter and GUI")
+    parser.add_argument("-s", "--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Scenario to run (repeatable, default: all)")
+    parser.add_argument("-a", "--algorithm", choices=sorted(ALGORITHMS), default=DEFAULT_ALGORITHM,
+                        help=f"Diff algorithm (default: {DEFAULT_ALGORITHM})")
+    parser.add_argument("-n", "--repeat", type=int, default=3, help="Timed runs per phase (default: 3)")
+    parser.add_argument("--no-gui", action="store_true", help="Skip the GUI rendering phase")
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against; exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="Slowdown factor counted as a regression (default: 1.2)")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    gui = None if args.no_gui else _make_gui()
+    if gui is None and not args.no_gui:
+        print("Tk is not available, skipping display_diff (try xvfb-run)", file=sys.stderr)
+
+    results = {
+        'engine_version': ENGINE_VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'results': [],
+    }
+    for name in args.scenario or SCENARIOS:
+        print(f"Running {name}...", file=sys.stderr)
+        results['results'].append(run_scenario(name, args.algorithm, args.repeat, gui))
+
+    print_table(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if baseline is not None:
+        regressions = compare_to_baseline(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.2f}x:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Measure command startup: time to the first byte of output for a small pair.
+
+    python benchmarks/startup.py                  # cdiff on test_files/
+    python benchmarks/startup.py --check          # exit 1 above the target
+    python benchmarks/startup.py --importtime     # slowest imports (-X importtime)
+"""
+import argparse
+import compileall
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SRC = os.path.join(ROOT, 'src')
+
+# Target for time to first byte on a small pair
+TARGET_SECONDS = 0.050
+
+# Entry point -> arguments; each is run with the small test pair
+COMMANDS = {
+    'cdiff': [os.path.join(SRC, 'cdiff.py')],
+    'cdiff-no-color': [os.path.join(SRC, 'cdiff.py'), '--no-color'],
+    'main': [os.path.join(SRC, 'main.py')],
+    'brief': [os.path.join(SRC, 'cdiff.py'), '-q'],
+}
+
+
+def time_to_first_byte(argv: List[str]) -> float:
+    """Seconds from spawning argv until its first byte of stdout arrives"""
+    start = time.perf_counter()
+    process = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    process.stdout.read(1)
+    elapsed = time.perf_counter() - start
+    process.stdout.read()
+    process.wait()
+    return elapsed
+
+
+def slowest_imports(argv: List[str], count: int) -> List[str]:
+    """The count imports with the largest cumulative time, from -X importtime"""
+    process = subprocess.run([sys.executable, '-X', 'importtime'] + argv,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    rows = []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        rows.append((int(cumulative), name.rstrip()))
+    rows.sort(reverse=True)
+    return [f"{micros / 1000:8.1f} ms  {name}" for micros, name in rows[:count]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark command startup time")
+    parser.add_argument("file1", nargs="?", default=os.path.join(ROOT, 'test_files', 'file1.txt'))
+    parser.add_argument("file2", nargs="?", default=os.path.join(ROOT, 'test_files', 'file2.txt'))
+    parser.add_argument("-n", "--repeat", type=int, default=20, help="Runs per command (default: 20)")
+    parser.add_argument("--check", action="store_true",
+                        help=f"Exit 1 if a median is above {TARGET_SECONDS * 1000:.0f} ms "
+                             "(minus the bare interpreter startup)")
+    parser.add_argument("--importtime", action="store_true", help="Show the slowest imports of cdiff")
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    # Measure with up-to-date bytecode, as an installed copy would have
+    compileall.compile_dir(SRC, quiet=1)
+
+    pair = [args.file1, args.file2]
+    baseline = statistics.median(
+        time_to_first_byte([sys.executable, '-c', 'print()']) for _ in range(args.repeat))
+    print(f"{'interpreter':<16} {baseline * 1000:7.1f} ms  (python -c 'print()')")
+
+    results = {'interpreter': baseline, 'target': TARGET_SECONDS, 'commands': {}}
+    failed = False
+    for name, command in COMMANDS.items():
+        argv = [sys.executable] + command + pair
+        times = [time_to_first_byte(argv) for _ in range(args.repeat)]
+        median = statistics.median(times)
+        results['commands'][name] = {'median': median, 'min': min(times)}
+        over = median - baseline > TARGET_SECONDS
+        failed = failed or over
+        print(f"{name:<16} {median * 1000:7.1f} ms  (min {min(times) * 1000:.1f} ms)"
+              f"{'  OVER TARGET' if over else ''}")
+
+    if args.importtime:
+        print("\nSlowest imports (cumulative):")
+        for line in slowest_imports(COMMANDS['cdiff'] + pair, 15):
+            print(f"  {line}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.check and failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,16 +5,19 @@ CLI Diff Tool - Command-line only file comparison
 
 import sys
 import os
-from pathlib import Path
 
 # Add src directory to path so we can import modules
-sys.path.insert(0, str(Path(__file__).parent))
-
-from cli import main as cli_main
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 def main():
     """Main entry point for cdiff command"""
+    # Hand the arguments to a running comparison server before importing the CLI
+    from diff_server import forward
+    exit_code = forward(sys.argv[1:])
+    if exit_code is not None:
+        sys.exit(exit_code)
     try:
+        from cli import main as cli_main
         cli_main()
     except ImportError as e:
         print(f"Error: CLI dependencies not available: {e}", file=sys.stderr)
@@ -1,23 +1,117 @@
 import argparse
+import re
 import sys
 import os
-from typing import List
-from colorama import init, Fore, Back, Style
-from diff_engine import DiffEngine, DiffLine, DiffType
+import time
+from collections import deque
+from contextlib import nullcontext
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple, Union
+from diff_engine import DiffEngine, DiffLine, DiffResult, DiffType
+from options import (add_compare_arguments, add_file_arguments, add_server_arguments, engine_arguments,
+                     resolve_path)
+from phase_timer import PhaseTimer, peak_rss
 
-# Initialize colorama for Windows support
-init(autoreset=True)
+class _NoColor:
+    """Stand-in for colorama's Fore/Back/Style whose codes are all empty"""
+    
+    def __getattr__(self, name: str) -> str:
+        return ""
+
+# Replaced by the colorama objects once color output is enabled
+Fore = Back = Style = _NoColor()
+
+def enable_color():
+    """Import and initialize colorama (for Windows support) on first use"""
+    global Fore, Back, Style
+    if isinstance(Style, _NoColor):
+        # Imported lazily: colorama is a noticeable part of startup time
+        from colorama import init, Fore, Back, Style
+        init(autoreset=True)
+
+def use_color(enabled: bool):
+    """Switch color codes on or off without wrapping stdout (the comparison server serves both)"""
+    global Fore, Back, Style
+    if not enabled:
+        Fore = Back = Style = _NoColor()
+    elif isinstance(Style, _NoColor):
+        from colorama import Fore, Back, Style
+
+# SGR escape sequences emitted by colorama
+ANSI_RE = re.compile(r'(\x1b\[[0-9;]*m)')
+
+# Output lines collected before each write to stdout
+OUTPUT_BATCH_LINES = 512
+
+def _phase(timer: Optional[PhaseTimer], name: str):
+    """timer.phase(name), or a no-op when not timing"""
+    return timer.phase(name) if timer is not None else nullcontext()
+
+class LineWriter:
+    """Collects output lines and writes them to a stream in batches"""
+    
+    def __init__(self, stream: TextIO = None, batch_lines: int = OUTPUT_BATCH_LINES,
+                 timer: Optional[PhaseTimer] = None):
+        self.stream = stream if stream is not None else sys.stdout
+        self.batch_lines = batch_lines
+        self.timer = timer
+        self.pending = []
+    
+    def write_line(self, line: str):
+        self.pending.append(line)
+        if len(self.pending) >= self.batch_lines:
+            self.flush()
+    
+    def flush(self):
+        with _phase(self.timer, "output"):
+            if self.pending:
+                if self.timer is not None:
+                    self.timer.count("output", len(self.pending))
+                self.pending.append("")
+                self.stream.write("\n".join(self.pending))
+                self.pending = []
+            self.stream.flush()
+
+def fold_rows(rows: Iterable[Tuple[DiffLine, DiffLine]],
+              context: int) -> Iterator[Union[int, Tuple[DiffLine, DiffLine]]]:
+    """Keep context equal rows around changes; runs of hidden rows become their count.
+    
+    Only the last context equal rows are buffered, so this works on streams.
+    """
+    pending = deque(maxlen=max(context, 0))
+    hidden = 0
+    after = 0
+    for row in rows:
+        if row[0].diff_type != DiffType.EQUAL:
+            if hidden:
+                yield hidden
+                hidden = 0
+            yield from pending
+            pending.clear()
+            yield row
+            after = context
+        elif after > 0:
+            yield row
+            after -= 1
+        else:
+            if len(pending) == context:
+                hidden += 1
+            pending.append(row)
+    hidden += len(pending)
+    if hidden:
+        yield hidden
 
 class ColoredFormatter:
     """Handles colored terminal output for diffs"""
     
     def __init__(self, use_color: bool = True):
         self.use_color = use_color
+        if use_color:
+            enable_color()
         
     def format_line(self, line: DiffLine, side: str = "left") -> str:
         """Format a single line with appropriate coloring"""
         if not self.use_color:
-            return self._format_plain_line(line)
+            return self._format_plain_line(line, side)
         
         line_num_str = f"{line.line_num:4d}" if line.line_num else "    "
         content = line.content
@@ -38,13 +132,38 @@ class ColoredFormatter:
             if line.line_num is not None:
                 color = Fore.RED if side == "left" else Fore.GREEN
                 symbol = "~" if side == "left" else "~"
+                if line.spans:
+                    highlight = Back.RED if side == "left" else Back.GREEN
+                    content = self._highlight_spans(content, line.spans, color, highlight)
                 return f"{color}{line_num_str}{Style.RESET_ALL} {color}{symbol} {content}{Style.RESET_ALL}"
             else:
                 return f"{Style.DIM}    {Style.RESET_ALL} "
+        elif line.diff_type == DiffType.MOVE:
+            note = self._move_note(line, side)
+            return (f"{Fore.MAGENTA}{line_num_str}{Style.RESET_ALL} {Fore.MAGENTA}M {content}{Style.RESET_ALL}"
+                    f"{Style.DIM}{note}{Style.RESET_ALL}")
         
         return f"{line_num_str} {content}"
     
-    def _format_plain_line(self, line: DiffLine) -> str:
+    def _move_note(self, line: DiffLine, side: str) -> str:
+        """Where a moved block went (left) or came from (right), on its first line only"""
+        i1, i2, j1, j2 = line.move
+        if side == "left":
+            return f" (moved to {j1 + 1}-{j2})" if line.line_num == i1 + 1 else ""
+        return f" (moved from {i1 + 1}-{i2})" if line.line_num == j1 + 1 else ""
+    
+    def _highlight_spans(self, content: str, spans, color: str, highlight: str) -> str:
+        """Highlight the changed spans of a line, keeping the line color elsewhere"""
+        parts = []
+        pos = 0
+        for start, end in spans:
+            parts.append(content[pos:start])
+            parts.append(f"{highlight}{Style.BRIGHT}{content[start:end]}{Style.RESET_ALL}{color}")
+            pos = end
+        parts.append(content[pos:])
+        return "".join(parts)
+    
+    def _format_plain_line(self, line: DiffLine, side: str = "left") -> str:
         """Format line without colors"""
         line_num_str = f"{line.line_num:4d}" if line.line_num else "    "
         content = line.content
@@ -55,42 +174,106 @@ class ColoredFormatter:
             return f"{line_num_str} + {content}"
         elif line.diff_type == DiffType.REPLACE and line.line_num is not None:
             return f"{line_num_str} ~ {content}"
+        elif line.diff_type == DiffType.MOVE:
+            return f"{line_num_str} M {content}{self._move_note(line, side)}"
         else:
             return f"{line_num_str} {content}"
 
 class SideBySideFormatter:
     """Formats diff output in side-by-side view"""
     
-    def __init__(self, use_color: bool = True, width: int = 80):
+    def __init__(self, use_color: bool = True, width: int = 80, timer: Optional[PhaseTimer] = None):
         self.use_color = use_color
         self.width = width
         self.half_width = (width - 3) // 2  # Account for separator
         self.formatter = ColoredFormatter(use_color)
+        self.timer = timer
+    
+    def _rows(self, rows: Iterable[Tuple[DiffLine, DiffLine]]) -> Iterable[Tuple[DiffLine, DiffLine]]:
+        """Rows, with building them timed separately from formatting when timing"""
+        return self.timer.wrap("rows", rows) if self.timer is not None else rows
     
     def format_diff(self, left_diff: List[DiffLine], right_diff: List[DiffLine], 
                    file1: str, file2: str) -> str:
         """Format the entire diff in side-by-side view"""
-        output = []
-        
-        # Header
-        header = self._format_header(file1, file2)
-        output.append(header)
-        output.append("=" * self.width)
-        
-        # Content
-        for i, (left_line, right_line) in enumerate(zip(left_diff, right_diff)):
-            left_formatted = self.formatter.format_line(left_line, "left")
-            right_formatted = self.formatter.format_line(right_line, "right")
+        return self.format_rows(zip(left_diff, right_diff), file1, file2)
+    
+    def format_rows(self, rows: Iterable[Tuple[DiffLine, DiffLine]], file1: str, file2: str) -> str:
+        """Format aligned (left, right) rows, e.g. a DiffResult, in side-by-side view"""
+        with _phase(self.timer, "format"):
+            output = []
             
-            # Truncate lines if they're too long
-            left_truncated = self._truncate_line(left_formatted, self.half_width)
-            right_truncated = self._truncate_line(right_formatted, self.half_width)
+            # Header
+            output.extend(self.format_header(file1, file2))
+            
+            # Content
+            for left_line, right_line in self._rows(rows):
+                output.append(self.format_row(left_line, right_line))
+            
+            return "\n".join(output)
+    
+    def write_result(self, result: DiffResult, file1: str, file2: str, writer: LineWriter,
+                     context: int = 3):
+        """Write a DiffResult hunk by hunk, hiding equal lines beyond context"""
+        with _phase(self.timer, "format"):
+            for header_line in self.format_header(file1, file2):
+                writer.write_line(header_line)
+            
+            if context < 0:
+                for left_line, right_line in self._rows(result):
+                    writer.write_line(self.format_row(left_line, right_line))
+                return
+            
+            shown_to = 0
+            for group in result.grouped_opcodes(context):
+                if group[0][1] > shown_to:
+                    writer.write_line(self.format_hidden(group[0][1] - shown_to))
+                for opcode in group:
+                    for left_line, right_line in self._rows(result.iter_opcode_rows(opcode)):
+                        writer.write_line(self.format_row(left_line, right_line))
+                shown_to = group[-1][2]
+            if len(result.lines1) > shown_to:
+                writer.write_line(self.format_hidden(len(result.lines1) - shown_to))
+    
+    def write_rows(self, rows: Iterable[Tuple[DiffLine, DiffLine]], file1: str, file2: str,
+                   writer: LineWriter, context: int = 3):
+        """Write streamed rows, hiding equal lines beyond context"""
+        with _phase(self.timer, "format"):
+            for header_line in self.format_header(file1, file2):
+                writer.write_line(header_line)
             
-            # Combine with separator
-            line = f"{left_truncated:<{self.half_width}} | {right_truncated}"
-            output.append(line)
+            rows = self._rows(rows)
+            if context >= 0:
+                rows = fold_rows(rows, context)
+            for row in rows:
+                if isinstance(row, int):
+                    writer.write_line(self.format_hidden(row))
+                else:
+                    writer.write_line(self.format_row(*row))
+    
+    def format_hidden(self, count: int) -> str:
+        """Separator standing in for a run of unchanged lines"""
+        text = f"@@ {count} line{'s' if count != 1 else ''} hidden @@"
+        if self.use_color:
+            return f"{Fore.CYAN}{text:^{self.width}}{Style.RESET_ALL}"
+        return f"{text:^{self.width}}"
+    
+    def format_row(self, left_line: DiffLine, right_line: DiffLine) -> str:
+        """Format one aligned pair of lines"""
+        left_formatted = self.formatter.format_line(left_line, "left")
+        right_formatted = self.formatter.format_line(right_line, "right")
+        
+        # Truncate lines if they're too long
+        left_truncated = self._truncate_line(left_formatted, self.half_width)
+        right_truncated = self._truncate_line(right_formatted, self.half_width)
         
-        return "\n".join(output)
+        # Combine with separator, padding by visible width
+        padding = " " * max(0, self.half_width - self._visible_len(left_truncated))
+        return f"{left_truncated}{padding} | {right_truncated}"
+    
+    def format_header(self, file1: str, file2: str) -> List[str]:
+        """Header lines: filenames and a separator rule"""
+        return [self._format_header(file1, file2), "=" * self.width]
     
     def _format_header(self, file1: str, file2: str) -> str:
         """Format the header showing filenames"""
@@ -105,95 +288,527 @@ class SideBySideFormatter:
         else:
             return f"{left_padded} | {right_padded}"
     
+    def _visible_len(self, line: str) -> int:
+        """Length of a line without ANSI escape sequences"""
+        if "\x1b" not in line:
+            return len(line)
+        return len(ANSI_RE.sub("", line))
+    
     def _truncate_line(self, line: str, max_width: int) -> str:
         """Truncate line to fit within width, handling ANSI codes"""
-        # Simple truncation for now - could be improved to handle ANSI codes better
-        if len(line) <= max_width:
+        if self._visible_len(line) <= max_width:
             return line
-        return line[:max_width-3] + "..."
+        if "\x1b" not in line:
+            return line[:max_width-3] + "..."
+        
+        # Keep escape sequences, count only visible characters
+        output = []
+        remaining = max_width - 3
+        for i, part in enumerate(ANSI_RE.split(line)):
+            if i % 2:
+                output.append(part)
+            elif remaining > 0:
+                output.append(part[:remaining])
+                remaining -= len(part[:remaining])
+        return "".join(output) + Style.RESET_ALL + "..."
+
+class UnifiedFormatter:
+    """Writes a raw DiffResult (see DiffEngine.diff_files) as a unified diff for patch.
+    
+    Lines are written back byte for byte, so line endings, encoding and a
+    missing final newline survive exactly.
+    """
+    
+    def __init__(self, context: int = 3, timer: Optional[PhaseTimer] = None):
+        self.context = context
+        self.timer = timer
+    
+    def _format_range(self, start: int, stop: int) -> str:
+        """Hunk range in the same form as difflib/GNU diff"""
+        length = stop - start
+        if length == 1:
+            return f"{start + 1}"
+        if length == 0:
+            return f"{start},0"
+        return f"{start + 1},{length}"
+    
+    def _format_label(self, label: str, filepath: str) -> bytes:
+        from datetime import datetime
+        mtime = datetime.fromtimestamp(os.stat(filepath).st_mtime).astimezone()
+        stamp = mtime.strftime('%Y-%m-%d %H:%M:%S.%f %z')
+        return f"{label}\t{stamp}\n".encode('utf-8', 'surrogateescape')
+    
+    def _format_lines(self, prefix: str, lines: List[str]) -> List[str]:
+        out = [prefix + line for line in lines]
+        if out and not out[-1].endswith('\n'):
+            out.append("\n\\ No newline at end of file\n")
+        return out
+    
+    def write_result(self, result: DiffResult, label1: str, label2: str,
+                     file1: str, file2: str, stream: BinaryIO):
+        """Write one hunk at a time; nothing is written for an unchanged result"""
+        lines1, lines2 = result.lines1, result.lines2
+        header = True
+        for group in result.grouped_opcodes(self.context):
+            with _phase(self.timer, "format"):
+                if header:
+                    hunk = [b"--- " + self._format_label(label1, file1),
+                            b"+++ " + self._format_label(label2, file2)]
+                    header = False
+                else:
+                    hunk = []
+                i1, i2 = group[0][1], group[-1][2]
+                j1, j2 = group[0][3], group[-1][4]
+                lines = [f"@@ -{self._format_range(i1, i2)} +{self._format_range(j1, j2)} @@\n"]
+                for tag, a1, a2, b1, b2 in group:
+                    if tag == 'equal' and a2 - a1 == b2 - b1:
+                        lines.extend(self._format_lines(" ", lines1[a1:a2]))
+                        continue
+                    if tag == 'equal':
+                        # Ignored blank lines on one side only; still needed for patch
+                        tag = 'replace'
+                    if tag in ('replace', 'delete'):
+                        lines.extend(self._format_lines("-", lines1[a1:a2]))
+                    if tag in ('replace', 'insert'):
+                        lines.extend(self._format_lines("+", lines2[b1:b2]))
+                hunk.append("".join(lines).encode('latin-1'))
+            with _phase(self.timer, "output"):
+                stream.write(b"".join(hunk))
+                if self.timer is not None:
+                    self.timer.count("output", len(lines))
+        stream.flush()
 
-def print_stats(stats: dict):
-    """Print diff statistics"""
-    print(f"\n{Style.BRIGHT}Statistics:{Style.RESET_ALL}")
-    print(f"  Lines added:   {Fore.GREEN}{stats['added_lines']}{Style.RESET_ALL}")
-    print(f"  Lines deleted: {Fore.RED}{stats['deleted_lines']}{Style.RESET_ALL}")
-    print(f"  Lines changed: {Fore.YELLOW}{stats['changed_lines']}{Style.RESET_ALL}")
-    print(f"  Lines unchanged: {stats['unchanged_lines']}")
+class JsonFormatter:
+    """Writes a DiffResult as JSON records: the file pair, one per hunk, then stats.
+    
+    ndjson writes one record per line; json writes the same records as one
+    array. Either way records are written as each hunk is formatted. Line
+    ranges are 0-based and end-exclusive, like the opcodes.
+    """
+    
+    def __init__(self, ndjson: bool = False, context: int = 3, contents: bool = True,
+                 timer: Optional[PhaseTimer] = None):
+        self.ndjson = ndjson
+        self.context = context
+        self.contents = contents
+        self.timer = timer
+        import json
+        self.encoder = json.JSONEncoder(separators=(',', ':'))
+    
+    def iter_records(self, result: DiffResult, file1: str, file2: str, stats: dict) -> Iterator[dict]:
+        yield {'type': 'files', 'old': file1, 'new': file2}
+        for group in result.grouped_opcodes(self.context):
+            ops = []
+            for tag, i1, i2, j1, j2 in group:
+                op = {'tag': tag, 'old': [i1, i2], 'new': [j1, j2]}
+                if self.contents:
+                    if tag == 'equal':
+                        # The longer side, in case ignored blank lines differ
+                        op['lines'] = result.lines1[i1:i2] if i2 - i1 >= j2 - j1 else result.lines2[j1:j2]
+                    if tag in ('replace', 'delete'):
+                        op['old_lines'] = result.lines1[i1:i2]
+                    if tag in ('replace', 'insert'):
+                        op['new_lines'] = result.lines2[j1:j2]
+                ops.append(op)
+            yield {'type': 'hunk', 'old': [group[0][1], group[-1][2]],
+                   'new': [group[0][3], group[-1][4]], 'ops': ops}
+        for i1, i2, j1, j2 in result.moves:
+            yield {'type': 'move', 'old': [i1, i2], 'new': [j1, j2]}
+        yield {'type': 'stats', **stats, 'identical': not result.has_differences}
+    
+    def write_result(self, result: DiffResult, file1: str, file2: str, stats: dict, writer: LineWriter):
+        with _phase(self.timer, "format"):
+            self._write_records(result, file1, file2, stats, writer)
+    
+    def _write_records(self, result: DiffResult, file1: str, file2: str, stats: dict, writer: LineWriter):
+        encoded = (self.encoder.encode(record)
+                   for record in self.iter_records(result, file1, file2, stats))
+        if self.ndjson:
+            for line in encoded:
+                writer.write_line(line)
+            return
+        # Hold back one record so the last one is written without a comma
+        writer.write_line("[")
+        previous = None
+        for line in encoded:
+            if previous is not None:
+                writer.write_line(previous + ",")
+            previous = line
+        writer.write_line(previous)
+        writer.write_line("]")
 
-def main():
-    parser = argparse.ArgumentParser(description="Windows Diff Tool - Side-by-side file comparison")
-    parser.add_argument("file1", help="First file to compare")
-    parser.add_argument("file2", help="Second file to compare")
-    parser.add_argument("-w", "--ignore-whitespace", action="store_true", 
-                       help="Ignore whitespace differences")
-    parser.add_argument("-c", "--context", type=int, default=3,
-                       help="Number of context lines to show")
-    parser.add_argument("--no-color", action="store_true",
-                       help="Disable colored output")
-    parser.add_argument("--width", type=int, default=120,
-                       help="Output width (default: 120)")
-    parser.add_argument("-s", "--stats", action="store_true",
-                       help="Show statistics")
-    parser.add_argument("--user-dir", help="Original user working directory for relative path resolution")
-    
-    args = parser.parse_args()
-    
-    # Convert relative paths to absolute paths
-    # Use user directory if provided, otherwise use current directory
-    base_dir = args.user_dir if args.user_dir else os.getcwd()
-    
-    if os.path.isabs(args.file1):
-        file1 = args.file1
+def print_stats(stats: dict, file=None):
+    """Print diff statistics (to stdout unless file is given)"""
+    print(f"\n{Style.BRIGHT}Statistics:{Style.RESET_ALL}", file=file)
+    print(f"  Lines added:   {Fore.GREEN}{stats['added_lines']}{Style.RESET_ALL}", file=file)
+    print(f"  Lines deleted: {Fore.RED}{stats['deleted_lines']}{Style.RESET_ALL}", file=file)
+    print(f"  Lines changed: {Fore.YELLOW}{stats['changed_lines']}{Style.RESET_ALL}", file=file)
+    print(f"  Lines moved:   {Fore.MAGENTA}{stats['moved_lines']}{Style.RESET_ALL}", file=file)
+    print(f"  Lines unchanged: {stats['unchanged_lines']}", file=file)
+    if stats.get('approximate'):
+        print(f"  {Fore.YELLOW}Approximate: cost budget exceeded{Style.RESET_ALL}", file=file)
+
+def print_progress(phase: str, done: int, total: int):
+    """Engine progress callback: one updating status line on stderr"""
+    percent = 100 * done // total if total else 100
+    label = "Reading" if phase == "read" else "Comparing"
+    end = "\n" if done >= total else ""
+    print(f"\r{label}: {percent:3d}%", end=end, file=sys.stderr, flush=True)
+
+def stream_diff(engine: DiffEngine, formatter: SideBySideFormatter, file1: str, file2: str,
+                writer: Optional[LineWriter], context: int) -> dict:
+    """Write rows as the engine streams them and return statistics.
+    
+    With no writer the rows are only counted.
+    """
+    stats = {
+        'total_lines_left': 0,
+        'total_lines_right': 0,
+        'added_lines': 0,
+        'deleted_lines': 0,
+        'changed_lines': 0,
+        'unchanged_lines': 0,
+        # Moves are not detected across stream windows
+        'moved_lines': 0,
+    }
+    
+    def engine_rows():
+        rows = engine.iter_compare_files(file1, file2)
+        # Reading and diffing happen inside the iterator
+        return engine.timer.wrap("stream", rows) if engine.timer is not None else rows
+    
+    def counted_rows():
+        for left_line, right_line in engine_rows():
+            count_row(left_line, right_line)
+            yield left_line, right_line
+    
+    def count_row(left_line: DiffLine, right_line: DiffLine):
+        if left_line.line_num is not None:
+            stats['total_lines_left'] += 1
+        if right_line.line_num is not None:
+            stats['total_lines_right'] += 1
+        if left_line.diff_type == DiffType.EQUAL:
+            stats['unchanged_lines'] += 1
+        elif left_line.diff_type == DiffType.REPLACE:
+            stats['changed_lines'] += 1
+        elif left_line.diff_type == DiffType.DELETE:
+            stats['deleted_lines'] += 1
+        else:
+            stats['added_lines'] += 1
+    
+    if writer is None:
+        for left_line, right_line in engine_rows():
+            count_row(left_line, right_line)
     else:
-        file1 = os.path.join(base_dir, args.file1)
-    file1 = os.path.abspath(file1)
+        formatter.write_rows(counted_rows(), file1, file2, writer, context)
+    stats['approximate'] = engine.approximate
+    return stats
+
+def print_timings(timer: PhaseTimer, peak_memory: Optional[int] = None, memory_source: str = "RSS"):
+    """Per-phase timing breakdown on stderr"""
+    print("\nTimings:", file=sys.stderr)
+    for line in timer.report(peak_memory, memory_source):
+        print(f"  {line}", file=sys.stderr)
+
+def run_merge(args: argparse.Namespace, engine: DiffEngine, base: str, file1: str, file2: str,
+              timer: Optional[PhaseTimer] = None) -> int:
+    """Write the three-way merge of file1 (ours) and file2 (theirs) against base; returns the exit code"""
+    if args.stream or args.format != "side-by-side":
+        raise ValueError("--merge cannot be combined with --stream or --format")
+    result = engine.compare3(base, file1, file2, raw=True)
+    if not (args.brief or args.stats_only):
+        with _phase(timer, "output"):
+            merged = "".join(result.merged_lines(args.file1, args.file2))
+            sys.stdout.flush()
+            # Raw lines are Latin-1 text, so this writes the original bytes back
+            sys.stdout.buffer.write(merged.encode('latin-1'))
+            sys.stdout.buffer.flush()
+    if args.stats or args.stats_only:
+        # stdout holds the merged file
+        stats = result.stats()
+        print(f"\nMerge: {stats['conflicts']} conflicts ({stats['conflict_lines']} lines), "
+              f"{stats['ours_lines']} lines from {args.file1}, {stats['theirs_lines']} from {args.file2}, "
+              f"{stats['both_lines']} changed the same on both sides", file=sys.stderr)
+    return 1 if result.conflicts else 0
+
+def run_watch(args: argparse.Namespace, engine: DiffEngine, formatter: SideBySideFormatter,
+              file1: str, file2: str) -> int:
+    """Show the diff again each time either file changes, until interrupted; returns the last exit code"""
+    if args.stream or args.format != "side-by-side":
+        raise ValueError("--watch cannot be combined with --stream or --format")
+    from watch import WatchedPair
+    pair = WatchedPair(engine, file1, file2)
+    result = pair.refresh()
+    try:
+        while True:
+            if args.brief:
+                state = "differ" if result.has_differences else "are identical"
+                print(f"Files {args.file1} and {args.file2} {state}", flush=True)
+            elif not args.stats_only:
+                writer = LineWriter()
+                formatter.write_result(result, file1, file2, writer, args.context)
+                writer.flush()
+            if args.stats or args.stats_only:
+                print_stats(engine.get_stats(result))
+            while True:
+                time.sleep(args.watch)
+                if pair.changed():
+                    result = pair.refresh() or result
+                    break
+            print(f"\n{Fore.CYAN}==> Changed at {time.strftime('%H:%M:%S')}{Style.RESET_ALL}", flush=True)
+    except KeyboardInterrupt:
+        return 1 if result.has_differences else 0
+
+def run_compare(args: argparse.Namespace, engine: DiffEngine, file1: str, file2: str,
+                timer: Optional[PhaseTimer] = None) -> int:
+    """Compare one file pair, write the requested output and return the exit code"""
+    formatter = SideBySideFormatter(
+        use_color=not args.no_color,
+        width=args.width,
+        timer=timer
+    )
+    
+    if args.merge:
+        return run_merge(args, engine, resolve_path(args.merge, args.user_dir), file1, file2, timer)
+    
+    if args.against_many:
+        # Missing targets are reported one by one
+        targets = [file2] + [resolve_path(path, args.user_dir) for path in args.more_files]
+        return run_against_many(args, engine, file1, targets)
+    
+    if args.watch is not None:
+        return run_watch(args, engine, formatter, file1, file2)
+    
+    # Brief and stats-only runs never build or format rows
+    quiet = args.brief or args.stats_only
+    writer = None if quiet else LineWriter(timer=timer)
     
-    if os.path.isabs(args.file2):
-        file2 = args.file2
+    if args.stream and args.format != "side-by-side" and not quiet:
+        raise ValueError(f"--format {args.format} cannot be combined with --stream")
+    
+    if args.format in ("json", "ndjson") and not quiet:
+        result = engine.diff_files(file1, file2)
+        JsonFormatter(args.format == "ndjson", args.context, not args.no_contents, timer).write_result(
+            result, args.file1, args.file2, engine.get_stats(result), writer)
+        writer.flush()
+        return 1 if result.has_differences else 0
+    
+    if args.format == "unified" and not quiet:
+        result = engine.diff_files(file1, file2, raw=True)
+        sys.stdout.flush()
+        UnifiedFormatter(args.context, timer).write_result(
+            result, args.file1, args.file2, file1, file2, sys.stdout.buffer)
+        if args.stats:
+            # stdout holds the patch
+            print_stats(engine.get_stats(result), file=sys.stderr)
+        return 1 if result.has_differences else 0
+    
+    if args.stream:
+        stats = stream_diff(engine, formatter, file1, file2, writer, args.context)
+        if writer is not None:
+            writer.flush()
+        has_differences = bool(stats['added_lines'] or stats['deleted_lines'] or stats['changed_lines'])
     else:
-        file2 = os.path.join(base_dir, args.file2)
-    file2 = os.path.abspath(file2)
+        # Compare files
+        result = engine.diff_files(file1, file2)
+        has_differences = result.has_differences
+        if writer is not None:
+            formatter.write_result(result, file1, file2, writer, args.context)
+            writer.flush()
+        if args.stats or args.stats_only:
+            stats = engine.get_stats(result)
+    
+    if args.brief and has_differences:
+        print(f"Files {args.file1} and {args.file2} differ")
+    
+    # Show statistics if requested
+    if args.stats or args.stats_only:
+        print_stats(stats)
+    
+    return 1 if has_differences else 0
+
+def run_recursive(dir1: str, dir2: str, engine_options: dict, jobs: int, show_stats: bool) -> int:
+    """Compare two directory trees, printing a summary line per file; returns exit code"""
+    from dir_compare import compare_trees, DIFFERENT, ERROR, ONLY_LEFT, ONLY_RIGHT
+    
+    totals = {
+        'total_lines_left': 0,
+        'total_lines_right': 0,
+        'added_lines': 0,
+        'deleted_lines': 0,
+        'changed_lines': 0,
+        'unchanged_lines': 0,
+        'moved_lines': 0,
+    }
+    counts = {'compared': 0, 'different': 0, 'only': 0, 'errors': 0}
+    for rel, status, stats in compare_trees(dir1, dir2, engine_options, jobs):
+        if status == ONLY_LEFT:
+            counts['only'] += 1
+            print(f"{Fore.RED}Only in {dir1}: {rel}{Style.RESET_ALL}", flush=True)
+            continue
+        if status == ONLY_RIGHT:
+            counts['only'] += 1
+            print(f"{Fore.GREEN}Only in {dir2}: {rel}{Style.RESET_ALL}", flush=True)
+            continue
+        if status == ERROR:
+            counts['errors'] += 1
+            print(f"Error: {rel}: {stats['error']}", file=sys.stderr, flush=True)
+            continue
+        
+        counts['compared'] += 1
+        if stats:
+            for key in totals:
+                totals[key] += stats[key]
+        if status == DIFFERENT:
+            counts['different'] += 1
+            approximate = ", approximate" if stats.get('approximate') else ""
+            moved = f", {stats['moved_lines']} moved" if stats['moved_lines'] else ""
+            print(f"{Fore.YELLOW}Files differ: {rel}{Style.RESET_ALL} "
+                  f"(+{stats['added_lines']} -{stats['deleted_lines']} ~{stats['changed_lines']}{moved}{approximate})",
+                  flush=True)
+    
+    print(f"\n{counts['compared']} files compared, {counts['different']} differ, "
+          f"{counts['only']} only on one side, {counts['errors']} errors")
+    if show_stats:
+        print_stats(totals)
+    
+    if counts['errors']:
+        return 2
+    return 1 if counts['different'] or counts['only'] else 0
+
+def run_against_many(args: argparse.Namespace, engine: DiffEngine, base: str, targets: List[str]) -> int:
+    """Compare base with every target, printing a line per target that differs; returns exit code"""
+    counts = {'compared': 0, 'different': 0, 'errors': 0}
+    totals = {}
+    names = dict(zip(targets, [args.file2] + args.more_files))
+    for target, result in engine.compare_many(base, targets, args.jobs or os.cpu_count() or 1):
+        name = names[target]
+        if isinstance(result, Exception):
+            counts['errors'] += 1
+            print(f"Error: {name}: {result}", file=sys.stderr, flush=True)
+            continue
+        counts['compared'] += 1
+        stats = result.stats()
+        for key, value in stats.items():
+            if key != 'approximate':
+                totals[key] = totals.get(key, 0) + value
+        if result.has_differences:
+            counts['different'] += 1
+            approximate = ", approximate" if stats['approximate'] else ""
+            moved = f", {stats['moved_lines']} moved" if stats['moved_lines'] else ""
+            print(f"{Fore.YELLOW}Files differ: {args.file1} {name}{Style.RESET_ALL} "
+                  f"(+{stats['added_lines']} -{stats['deleted_lines']} ~{stats['changed_lines']}{moved}{approximate})",
+                  flush=True)
+    
+    print(f"\n{counts['compared']} files compared with {args.file1}, {counts['different']} differ, "
+          f"{counts['errors']} errors")
+    if args.stats and totals:
+        print_stats(totals)
+    
+    if counts['errors']:
+        return 2
+    return 1 if counts['different'] else 0
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Windows Diff Tool - Side-by-side file comparison")
+    add_file_arguments(parser, optional=True, many=True)
+    add_compare_arguments(parser)
+    add_server_arguments(parser)
+    return parser
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    """Parse cdiff arguments; both files are required unless starting the server"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.serve and (not args.file1 or not args.file2):
+        parser.error("the following arguments are required: file1, file2")
+    return args
+
+def run(args: argparse.Namespace, prepared_cache: Optional[dict] = None) -> int:
+    """Run a comparison for parsed arguments (see options.py) and return the exit code.
+
+    prepared_cache is kept by a long-running caller (see diff_server.py) so
+    reference files are only prepared again once they change. Such a run
+    leaves the peak RSS out of --timings: it would be the caller's, over
+    every run so far.
+    """
+    file1 = resolve_path(args.file1, args.user_dir)
+    file2 = resolve_path(args.file2, args.user_dir)
+    
+    if not args.no_color:
+        enable_color()
+    
+    engine_options = engine_arguments(args)
+    
+    if args.more_files and not args.against_many:
+        print("Error: more than two files need --against-many", file=sys.stderr)
+        return 2
+    
+    if args.recursive:
+        for path, arg in ((file1, args.file1), (file2, args.file2)):
+            if not os.path.isdir(path):
+                print(f"Error: Directory '{arg}' not found", file=sys.stderr)
+                return 2
+        return run_recursive(file1, file2, engine_options, args.jobs, args.stats)
     
     # Check if files exist
     if not os.path.exists(file1):
         print(f"Error: File '{args.file1}' not found", file=sys.stderr)
-        sys.exit(1)
+        return 1
     
-    if not os.path.exists(file2):
+    if not os.path.exists(file2) and not args.against_many:
         print(f"Error: File '{args.file2}' not found", file=sys.stderr)
-        sys.exit(1)
+        return 1
+    
+    if args.merge and not os.path.exists(resolve_path(args.merge, args.user_dir)):
+        print(f"Error: File '{args.merge}' not found", file=sys.stderr)
+        return 2
+    
+    timer = PhaseTimer() if args.timings or args.trace_memory else None
+    if args.trace_memory:
+        # Traces every allocation: phase times are many times slower than normal
+        import tracemalloc
+        tracemalloc.start()
     
     # Create diff engine
-    engine = DiffEngine(
-        ignore_whitespace=args.ignore_whitespace,
-        context_lines=args.context
-    )
+    engine = DiffEngine(progress=print_progress if args.progress else None, timer=timer,
+                        jobs=args.jobs or 1, prepared_cache=prepared_cache, **engine_options)
     
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
     try:
-        # Compare files
-        left_diff, right_diff = engine.compare_files(file1, file2)
-        
-        # Format output
-        formatter = SideBySideFormatter(
-            use_color=not args.no_color,
-            width=args.width
-        )
-        
-        diff_output = formatter.format_diff(left_diff, right_diff, file1, file2)
-        print(diff_output)
-        
-        # Show statistics if requested
-        if args.stats:
-            stats = engine.get_stats(left_diff, right_diff)
-            print_stats(stats)
-        
-        # Exit with appropriate code
-        has_differences = any(line.diff_type != DiffType.EQUAL for line in left_diff)
-        sys.exit(1 if has_differences else 0)
-        
+        if profiler is not None:
+            profiler.enable()
+        try:
+            exit_code = run_compare(args, engine, file1, file2, timer)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(args.profile)
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
-        sys.exit(2)
+        return 2
+    
+    if engine.approximate and not args.against_many:
+        print("Warning: cost budget exceeded, the diff is approximate", file=sys.stderr)
+    
+    if args.trace_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print_timings(timer, peak_memory, "traced")
+    elif timer is not None:
+        print_timings(timer, peak_rss() if prepared_cache is None else None)
+    
+    return exit_code
+
+def main(argv: Optional[Sequence[str]] = None):
+    args = parse_args(argv)
+    if args.serve:
+        from diff_server import serve
+        sys.exit(serve())
+    sys.exit(run(args))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,133 @@
+import os
+from typing import List, Optional, Tuple
+
+# Default size limit for the whole cache directory
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Eviction trims the cache to this fraction of max_bytes, so the directory
+# is only scanned again after that much has been added
+EVICT_TARGET = 0.75
+
+# File in the cache directory holding the running total of entry sizes
+SIZE_FILE = 'size'
+
+Opcode = Tuple[str, int, int, int, int]
+
+
+def default_cache_dir() -> str:
+    """Per-user cache directory (LOCALAPPDATA on Windows, XDG cache elsewhere)"""
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME')
+    if not base:
+        base = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'wdiff')
+
+
+class DiffCache:
+    """On-disk cache of diff opcodes keyed by file content hashes and options.
+
+    Each entry is a small JSON file. Reading an entry refreshes its mtime, and
+    the least recently used entries are deleted once the directory grows past
+    max_bytes. The total size is kept in a file next to the entries, so a put
+    only scans the directory when that total goes over the limit.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+
+    def make_key(self, digest1: str, digest2: str, options: tuple) -> str:
+        """Cache key for a file pair compared with the given engine options"""
+        # hashlib, json and tempfile are imported on use to keep CLI startup fast
+        import hashlib
+        import json
+        material = json.dumps([digest1, digest2, list(options)], separators=(',', ':'))
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+    def get(self, key: str) -> Optional[List[Opcode]]:
+        """Cached opcodes for key, or None on a miss"""
+        import json
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return [tuple(opcode) for opcode in entry['opcodes']]
+
+    def put(self, key: str, opcodes: List[Opcode]):
+        """Store opcodes for key and evict old entries if over the size limit"""
+        path = self._path(key)
+        try:
+            import json
+            import tempfile
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            # Write to a temp file first so readers never see a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'opcodes': opcodes}, f, separators=(',', ':'))
+                added = f.tell() - replaced
+            os.replace(tmp_path, path)
+        except OSError:
+            # The cache is best effort
+            return
+        total = self._read_size()
+        if total is None or total + added > self.max_bytes:
+            self.evict()
+        else:
+            self._write_size(total + added)
+
+    def _read_size(self) -> Optional[int]:
+        """Running total of entry sizes, or None if it was never written"""
+        try:
+            with open(os.path.join(self.cache_dir, SIZE_FILE), 'r', encoding='ascii') as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def _write_size(self, total: int):
+        # Processes sharing the cache may race here; the next eviction scan corrects the total
+        try:
+            with open(os.path.join(self.cache_dir, SIZE_FILE), 'w', encoding='ascii') as f:
+                f.write(str(max(total, 0)))
+        except OSError:
+            pass
+
+    def evict(self):
+        """Delete least recently used entries once the cache is over max_bytes.
+
+        Trims it to EVICT_TARGET of max_bytes and records the size that is left.
+        """
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for name in filenames:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        if total > self.max_bytes:
+            target = self.max_bytes * EVICT_TARGET
+            entries.sort()
+            for _, size, path in entries:
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                if total <= target:
+                    break
+        self._write_size(total)
+
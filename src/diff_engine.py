@@ -1,121 +1,1829 @@
+import bisect
 import difflib
+import functools
+import itertools
+import mmap
+import os
 import re
-from typing import List, Tuple, Optional
+import threading
+import time
+from array import array
+from contextlib import nullcontext
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple, Optional, Union
 from enum import Enum
 
+from normalizers import Normalizer
+from phase_timer import PhaseTimer
+
+# (tag, i1, i2, j1, j2) as produced by difflib.SequenceMatcher.get_opcodes()
+Opcode = Tuple[str, int, int, int, int]
+# (i, j, size) runs of matching items, sorted by i
+MatchBlock = Tuple[int, int, int]
+# (i1, i2, j1, j2): lines1[i1:i2] were moved to lines2[j1:j2]
+Move = Tuple[int, int, int, int]
+
 
 class DiffType(Enum):
     EQUAL = "equal"
     DELETE = "delete"
     INSERT = "insert"
     REPLACE = "replace"
+    # Three-way comparisons only: both sides changed the same base lines differently
+    CONFLICT = "conflict"
+    # A deleted block found again among the inserted lines (see DiffLine.move)
+    MOVE = "move"
+
+
+# (start, end) character offsets of a changed span within DiffLine.content
+Span = Tuple[int, int]
 
 
 class DiffLine:
-    def __init__(self, line_num: Optional[int], content: str, diff_type: DiffType):
+    __slots__ = ('line_num', 'content', 'diff_type', 'spans', 'move')
+
+    def __init__(self, line_num: Optional[int], content: str, diff_type: DiffType,
+                 spans: Optional[Sequence[Span]] = None, move: Optional[Move] = None):
         self.line_num = line_num
         self.content = content
         self.diff_type = diff_type
+        # Changed parts of a paired REPLACE line; None means the whole line
+        self.spans = spans
+        # Source and destination ranges of the block a MOVE line belongs to
+        self.move = move
 
     def __repr__(self):
         return f"DiffLine({self.line_num}, {self.content[:20]}..., {self.diff_type})"
 
 
+# Intraline diff limits: longer lines, or token pairs costing more than
+# INTRALINE_MAX_COST comparisons, are highlighted as a whole line
+INTRALINE_MAX_CHARS = 5000
+INTRALINE_MAX_COST = 250000
+INTRALINE_CACHE_SIZE = 4096
+INTRALINE_MODES = ('word', 'char')
+
+_WORD_RE = re.compile(r'\w+|\s+|[^\w\s]')
+
+
+def _tokenize(text: str, mode: str) -> List[str]:
+    if mode == 'char':
+        return list(text)
+    return _WORD_RE.findall(text)
+
+
+@functools.lru_cache(maxsize=INTRALINE_CACHE_SIZE)
+def intraline_spans(old: str, new: str, mode: str = 'word') -> Optional[Tuple[Tuple[Span, ...], Tuple[Span, ...]]]:
+    """Changed character spans of a replaced line pair, or None if over the cost cap"""
+    if len(old) > INTRALINE_MAX_CHARS or len(new) > INTRALINE_MAX_CHARS:
+        return None
+    tokens1 = _tokenize(old, mode)
+    tokens2 = _tokenize(new, mode)
+    if len(tokens1) * len(tokens2) > INTRALINE_MAX_COST:
+        return None
+
+    # Character offset of every token boundary
+    offsets1 = [0]
+    for token in tokens1:
+        offsets1.append(offsets1[-1] + len(token))
+    offsets2 = [0]
+    for token in tokens2:
+        offsets2.append(offsets2[-1] + len(token))
+
+    spans1 = []
+    spans2 = []
+    matcher = difflib.SequenceMatcher(None, tokens1, tokens2, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        if i2 > i1:
+            spans1.append((offsets1[i1], offsets1[i2]))
+        if j2 > j1:
+            spans2.append((offsets2[j1], offsets2[j2]))
+    return tuple(spans1), tuple(spans2)
+
+
+_TAG_TYPES = {
+    'equal': DiffType.EQUAL,
+    'delete': DiffType.DELETE,
+    'insert': DiffType.INSERT,
+    'replace': DiffType.REPLACE,
+}
+
+
+class _MoveIndex:
+    """Moves sorted by source and by destination, to look lines up by bisection"""
+
+    def __init__(self, moves: Sequence[Move]):
+        self.by_source = sorted(moves)
+        self.by_target = sorted(moves, key=lambda move: move[2])
+        self.source_starts = [move[0] for move in self.by_source]
+        self.target_starts = [move[2] for move in self.by_target]
+        # Moved lines before each move (both orders), to count them per opcode
+        self.source_counts = list(itertools.accumulate([0] + [i2 - i1 for i1, i2, _, _ in self.by_source]))
+        self.target_counts = list(itertools.accumulate([0] + [j2 - j1 for _, _, j1, j2 in self.by_target]))
+
+    def source(self, i: int) -> Optional[Move]:
+        """The move whose source holds line i of lines1"""
+        k = bisect.bisect_right(self.source_starts, i) - 1
+        if k >= 0 and i < self.by_source[k][1]:
+            return self.by_source[k]
+        return None
+
+    def target(self, j: int) -> Optional[Move]:
+        """The move whose destination holds line j of lines2"""
+        k = bisect.bisect_right(self.target_starts, j) - 1
+        if k >= 0 and j < self.by_target[k][3]:
+            return self.by_target[k]
+        return None
+
+    def sources_in(self, lo: int, hi: int) -> int:
+        """Moved lines of lines1 in lo..hi (a move never straddles an opcode)"""
+        return (self.source_counts[bisect.bisect_left(self.source_starts, hi)] -
+                self.source_counts[bisect.bisect_left(self.source_starts, lo)])
+
+    def targets_in(self, lo: int, hi: int) -> int:
+        """Moved lines of lines2 in lo..hi"""
+        return (self.target_counts[bisect.bisect_left(self.target_starts, hi)] -
+                self.target_counts[bisect.bisect_left(self.target_starts, lo)])
+
+
+def _pieces(lo: int, hi: int, starts: List[int], spans: List[Tuple[int, int]]) -> List[Tuple[bool, int, int]]:
+    """Cut lo..hi into (moved, start, stop) pieces at the moved spans inside it"""
+    pieces = []
+    k = bisect.bisect_left(starts, lo)
+    while k < len(spans) and spans[k][0] < hi:
+        start, stop = spans[k]
+        if start > lo:
+            pieces.append((False, lo, start))
+        pieces.append((True, start, stop))
+        lo = stop
+        k += 1
+    if lo < hi:
+        pieces.append((False, lo, hi))
+    return pieces
+
+
+def _split_moved(opcodes: List[Opcode], moves: Sequence[Move]) -> List[Opcode]:
+    """Opcodes with every moved block as its own delete or insert.
+
+    Moved lines of a replace would otherwise share rows with the unrelated
+    lines of the other side; the lines left around them stay paired.
+    """
+    sources = sorted((i1, i2) for i1, i2, _, _ in moves)
+    targets = sorted((j1, j2) for _, _, j1, j2 in moves)
+    source_starts = [i1 for i1, _ in sources]
+    target_starts = [j1 for j1, _ in targets]
+    result = []
+    for opcode in opcodes:
+        tag, i1, i2, j1, j2 = opcode
+        if tag == 'equal':
+            result.append(opcode)
+            continue
+        left = _pieces(i1, i2, source_starts, sources)
+        right = _pieces(j1, j2, target_starts, targets)
+        if len(left) <= 1 and len(right) <= 1 and not any(moved for moved, _, _ in left + right):
+            result.append(opcode)
+            continue
+        a = b = 0
+        i, j = i1, j1
+        while a < len(left) or b < len(right):
+            if a < len(left) and (left[a][0] or b == len(right)):
+                _, lo, hi = left[a]
+                result.append(('delete', lo, hi, j, j))
+                i = hi
+                a += 1
+            elif b < len(right) and (right[b][0] or a == len(left)):
+                _, lo, hi = right[b]
+                result.append(('insert', i, i, lo, hi))
+                j = hi
+                b += 1
+            else:
+                # Unmoved lines on both sides: pair them as before
+                _, lo1, hi1 = left[a]
+                _, lo2, hi2 = right[b]
+                result.append(('replace', lo1, hi1, lo2, hi2))
+                i, j = hi1, hi2
+                a += 1
+                b += 1
+    return result
+
+
+def _iter_opcode_rows(opcode: Opcode, lines1: Sequence[str], lines2: Sequence[str],
+                      lo: int, hi: int, offset1: int = 0, offset2: int = 0,
+                      intraline: Optional[str] = None,
+                      moves: Optional[_MoveIndex] = None) -> Iterator[Tuple[DiffLine, DiffLine]]:
+    """Yield rows lo..hi of one opcode; a side that runs out gets empty padding rows"""
+    tag, i1, i2, j1, j2 = opcode
+    diff_type = _TAG_TYPES[tag]
+    left_count = i2 - i1
+    right_count = j2 - j1
+    if tag == 'equal':
+        moves = None
+    for k in range(lo, hi):
+        if k < left_count:
+            left_line = DiffLine(offset1 + i1 + k + 1, lines1[i1 + k], diff_type)
+            if moves is not None:
+                left_line.move = moves.source(i1 + k)
+                if left_line.move is not None:
+                    left_line.diff_type = DiffType.MOVE
+        else:
+            left_line = DiffLine(None, "", diff_type)
+        if k < right_count:
+            right_line = DiffLine(offset2 + j1 + k + 1, lines2[j1 + k], diff_type)
+            if moves is not None:
+                right_line.move = moves.target(j1 + k)
+                if right_line.move is not None:
+                    right_line.diff_type = DiffType.MOVE
+        else:
+            right_line = DiffLine(None, "", diff_type)
+        if (intraline and tag == 'replace' and k < left_count and k < right_count and
+                left_line.move is None and right_line.move is None):
+            spans = intraline_spans(left_line.content, right_line.content, intraline)
+            if spans is not None:
+                left_line.spans, right_line.spans = spans
+        yield left_line, right_line
+
+
+class DiffResult:
+    """Compact diff: opcode ranges over the source line lists.
+
+    DiffLine rows are only built while iterating, so a large mostly-equal
+    diff costs a handful of opcodes instead of two DiffLine lists.
+    """
+    __slots__ = ('lines1', 'lines2', 'opcodes', 'intraline', 'approximate', 'moves', '_moves',
+                 '_row_starts')
+
+    def __init__(self, lines1: Sequence[str], lines2: Sequence[str], opcodes: List[Opcode],
+                 intraline: Optional[str] = None, approximate: bool = False, moves: Sequence[Move] = ()):
+        self.lines1 = lines1
+        self.lines2 = lines2
+        # 'word' or 'char' to attach changed spans to paired REPLACE rows
+        self.intraline = intraline
+        # True when the cost budget ran out and a cheaper heuristic finished the diff
+        self.approximate = approximate
+        # Deleted blocks found again among the inserted lines (see find_moves);
+        # their rows are MOVE instead of DELETE/INSERT/REPLACE, never paired
+        # with other lines
+        self.moves = list(moves)
+        self._moves = _MoveIndex(self.moves) if self.moves else None
+        self.opcodes = _split_moved(opcodes, self.moves) if self.moves else opcodes
+        # Row index where each opcode starts, plus the total at the end
+        starts = array('q', [0])
+        for tag, i1, i2, j1, j2 in self.opcodes:
+            starts.append(starts[-1] + max(i2 - i1, j2 - j1))
+        self._row_starts = starts
+
+    def __len__(self) -> int:
+        return self._row_starts[-1]
+
+    def __iter__(self) -> Iterator[Tuple[DiffLine, DiffLine]]:
+        return self.iter_rows()
+
+    def iter_rows(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[DiffLine, DiffLine]]:
+        """Yield aligned (left, right) rows in the range start..stop"""
+        starts = self._row_starts
+        stop = len(self) if stop is None else min(stop, len(self))
+        if start >= stop:
+            return
+        idx = bisect.bisect_right(starts, start) - 1
+        while start < stop:
+            op_start = starts[idx]
+            op_stop = min(stop, starts[idx + 1])
+            yield from _iter_opcode_rows(self.opcodes[idx], self.lines1, self.lines2,
+                                         start - op_start, op_stop - op_start,
+                                         intraline=self.intraline, moves=self._moves)
+            start = op_stop
+            idx += 1
+
+    def iter_opcode_rows(self, opcode: Opcode) -> Iterator[Tuple[DiffLine, DiffLine]]:
+        """Yield the rows of one opcode (e.g. one from grouped_opcodes)"""
+        _, i1, i2, j1, j2 = opcode
+        return _iter_opcode_rows(opcode, self.lines1, self.lines2, 0, max(i2 - i1, j2 - j1),
+                                 intraline=self.intraline, moves=self._moves)
+
+    def grouped_opcodes(self, context: int = 3) -> Iterator[List[Opcode]]:
+        """Group changes into hunks with up to context equal lines around them.
+
+        Works like difflib.SequenceMatcher.get_grouped_opcodes(), except that
+        an unchanged diff yields no hunks and a negative context yields every
+        opcode as a single hunk.
+        """
+        if not self.has_differences:
+            return
+        codes = list(self.opcodes)
+        if context < 0:
+            yield codes
+            return
+
+        # Trim the leading and trailing equal runs down to the context
+        tag, i1, i2, j1, j2 = codes[0]
+        if tag == 'equal':
+            codes[0] = tag, max(i1, i2 - context), i2, max(j1, j2 - context), j2
+        tag, i1, i2, j1, j2 = codes[-1]
+        if tag == 'equal':
+            codes[-1] = tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)
+
+        # Split on equal runs longer than both contexts together
+        group = []
+        for tag, i1, i2, j1, j2 in codes:
+            if tag == 'equal' and i2 - i1 > 2 * context:
+                group.append((tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)))
+                yield group
+                group = []
+                i1, j1 = max(i1, i2 - context), max(j1, j2 - context)
+            group.append((tag, i1, i2, j1, j2))
+        if group and not (len(group) == 1 and group[0][0] == 'equal'):
+            yield group
+
+    @property
+    def left_diff(self) -> List[DiffLine]:
+        """Materialized left-side rows"""
+        return [left_line for left_line, _ in self]
+
+    @property
+    def right_diff(self) -> List[DiffLine]:
+        """Materialized right-side rows"""
+        return [right_line for _, right_line in self]
+
+    @property
+    def has_differences(self) -> bool:
+        return any(tag != 'equal' for tag, _, _, _, _ in self.opcodes)
+
+    def stats(self) -> dict:
+        """Statistics computed from the opcodes (same keys as DiffEngine.get_stats).
+
+        Moved lines are counted once, as moved_lines, and not as deleted,
+        added or changed.
+        """
+        added = deleted = changed = unchanged = 0
+        moves = self._moves
+        for tag, i1, i2, j1, j2 in self.opcodes:
+            left = i2 - i1
+            right = j2 - j1
+            if tag == 'equal':
+                # Ignored blank lines can make the two sides differ in length
+                unchanged += max(left, right)
+                continue
+            if moves is not None:
+                left -= moves.sources_in(i1, i2)
+                right -= moves.targets_in(j1, j2)
+            if tag == 'delete':
+                deleted += left
+            elif tag == 'insert':
+                added += right
+            else:
+                changed += max(left, right)
+        return {
+            'total_lines_left': len(self.lines1),
+            'total_lines_right': len(self.lines2),
+            'added_lines': added,
+            'deleted_lines': deleted,
+            'changed_lines': changed,
+            'unchanged_lines': unchanged,
+            'moved_lines': moves.source_counts[-1] if moves is not None else 0,
+            'approximate': self.approximate,
+        }
+
+
+def _split_rows(result: DiffResult) -> Tuple[List[DiffLine], List[DiffLine]]:
+    """Materialize a DiffResult into left and right DiffLine lists"""
+    left_diff = []
+    right_diff = []
+    for left_line, right_line in result:
+        left_diff.append(left_line)
+        right_diff.append(right_line)
+    return left_diff, right_diff
+
+
+def _split_lines(text: str) -> List[str]:
+    """Split decoded text into lines like universal-newline readlines() + rstrip"""
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    lines = text.split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    return lines
+
+
+def decode_lines(data, encoding: Optional[str] = None) -> Tuple[List[str], str]:
+    """Decode file contents into lines; returns (lines, encoding used).
+
+    Without an encoding UTF-8 is tried first, then Latin-1.
+    """
+    if encoding is None:
+        try:
+            return _split_lines(str(data, 'utf-8')), 'utf-8'
+        except UnicodeDecodeError:
+            encoding = 'latin-1'
+    return _split_lines(str(data, encoding)), encoding
+
+
+# One raw line including its '\n' ending, split the way diff/patch count lines
+_RAW_LINE_RE = re.compile(r'[^\n]*\n|[^\n]+\Z')
+
+
+def _raw_lines(data) -> List[str]:
+    """Latin-1 lines that keep their endings (round-trips to the exact bytes)"""
+    return _RAW_LINE_RE.findall(str(data, 'latin-1'))
+
+
+def _sha256(data) -> str:
+    """SHA-256 of bytes or a mapped file, hashed in IDENTICAL_CHUNK slices"""
+    # Imported here to keep startup fast; only needed for cached comparisons
+    import hashlib
+    digest = hashlib.sha256()
+    for pos in range(0, len(data), IDENTICAL_CHUNK):
+        digest.update(data[pos:pos + IDENTICAL_CHUNK])
+    return digest.hexdigest()
+
+
+def _count_lines(filepath: str, raw: bool = False) -> int:
+    """Number of lines _read_file (or _read_raw_file) would return, counted without decoding.
+
+    Line breaks are ASCII in both UTF-8 and Latin-1, so they can be
+    counted in the bytes.
+    """
+    with open(filepath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            count = 0
+            previous = b''
+            for pos in range(0, len(data), IDENTICAL_CHUNK):
+                chunk = data[pos:pos + IDENTICAL_CHUNK]
+                count += chunk.count(b'\n')
+                if not raw:
+                    # '\r' and '\r\n' end a line too, '\r\n' only once
+                    returns = chunk.count(b'\r')
+                    if returns:
+                        count += returns - chunk.count(b'\r\n')
+                    if previous == b'\r' and chunk[:1] == b'\n':
+                        count -= 1
+                    previous = chunk[-1:]
+            last = data[-1:]
+    if last != b'\n' and (raw or last != b'\r'):
+        # Unterminated last line
+        count += 1
+    return count
+
+
+class _FileLines:
+    """Lines of a file that are only read and decoded when first needed.
+
+    len() counts line breaks in the bytes instead, so a result for
+    identical files answers --brief and --stats without decoding them.
+    """
+
+    def __init__(self, filepath: str, read_file: Callable[[str], List[str]], raw: bool = False):
+        self.filepath = filepath
+        self._read_file = read_file
+        self._raw = raw
+        self._lines: Optional[List[str]] = None
+        self._count: Optional[int] = None
+
+    def _load(self) -> List[str]:
+        if self._lines is None:
+            self._lines = self._read_file(self.filepath)
+        return self._lines
+
+    def __len__(self) -> int:
+        if self._lines is not None:
+            return len(self._lines)
+        if self._count is None:
+            self._count = _count_lines(self.filepath, self._raw)
+        return self._count
+
+    def __getitem__(self, index):
+        return self._load()[index]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._load())
+
+
+def _expand_blank_gaps(opcodes: List[Opcode], index1: Sequence[int], index2: Sequence[int],
+                       n: int, m: int) -> List[Opcode]:
+    """Map opcodes over the non-blank lines back onto all n and m lines.
+
+    Blank lines between matched or changed lines become 'equal' opcodes. Where
+    one side has more of them, the surplus is an 'equal' opcode with an empty
+    other side, so blank-only changes never count as differences. Blank lines
+    inside a changed region stay part of the change.
+    """
+    result = []
+    pos1 = pos2 = 0
+
+    def add(tag: str, a1: int, a2: int, b1: int, b2: int):
+        if a1 == a2 and b1 == b2:
+            return
+        if result and tag == 'equal' and a2 - a1 == b2 - b1:
+            last_tag, l1, l2, k1, k2 = result[-1]
+            if last_tag == 'equal' and l2 == a1 and k2 == b1 and l2 - l1 == k2 - k1:
+                result[-1] = ('equal', l1, a2, k1, b2)
+                return
+        result.append((tag, a1, a2, b1, b2))
+
+    def skip_blanks(to1: int, to2: int):
+        nonlocal pos1, pos2
+        common = min(to1 - pos1, to2 - pos2)
+        add('equal', pos1, pos1 + common, pos2, pos2 + common)
+        add('equal', pos1 + common, to1, pos2 + common, to2)
+        pos1, pos2 = to1, to2
+
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == 'equal':
+            if index1[i2 - 1] - index1[i1] == i2 - i1 - 1 and index2[j2 - 1] - index2[j1] == j2 - j1 - 1:
+                # No blank lines inside this run
+                skip_blanks(index1[i1], index2[j1])
+                add('equal', pos1, index1[i2 - 1] + 1, pos2, index2[j2 - 1] + 1)
+                pos1, pos2 = index1[i2 - 1] + 1, index2[j2 - 1] + 1
+                continue
+            for k in range(i2 - i1):
+                skip_blanks(index1[i1 + k], index2[j1 + k])
+                add('equal', pos1, pos1 + 1, pos2, pos2 + 1)
+                pos1 += 1
+                pos2 += 1
+        else:
+            skip_blanks(index1[i1] if i1 < i2 else pos1, index2[j1] if j1 < j2 else pos2)
+            end1 = index1[i2 - 1] + 1 if i1 < i2 else pos1
+            end2 = index2[j2 - 1] + 1 if j1 < j2 else pos2
+            add(tag, pos1, end1, pos2, end2)
+            pos1, pos2 = end1, end2
+    skip_blanks(n, m)
+    return result
+
+
+# Histogram diff calls check() every this many positions of a region
+CHECK_INTERVAL = 1024
+
+# Lines that occur more often than this in a region are never used as
+# histogram anchors; such regions fall back to Myers
+HISTOGRAM_MAX_CHAIN = 64
+
+# Edit distance one Myers middle-snake search explores before giving up:
+# its pure-Python cost grows with the square of it, so densely edited
+# regions past this are split where the search got furthest instead
+MYERS_MAX_D = 512
+
+
+def _opcodes_from_blocks(blocks: List[MatchBlock], n: int, m: int) -> List[Opcode]:
+    """Turn sorted matching blocks into SequenceMatcher-style opcodes"""
+    opcodes = []
+    i = j = 0
+    for ai, bj, size in blocks + [(n, m, 0)]:
+        tag = ''
+        if i < ai and j < bj:
+            tag = 'replace'
+        elif i < ai:
+            tag = 'delete'
+        elif j < bj:
+            tag = 'insert'
+        if tag:
+            opcodes.append((tag, i, ai, j, bj))
+        i, j = ai + size, bj + size
+        if size:
+            opcodes.append(('equal', ai, i, bj, j))
+    return opcodes
+
+
+def _merge_blocks(blocks: List[MatchBlock]) -> List[MatchBlock]:
+    """Sort matching blocks and join the ones that touch"""
+    merged = []
+    for i, j, size in sorted(blocks):
+        if merged:
+            pi, pj, psize = merged[-1]
+            if pi + psize == i and pj + psize == j:
+                merged[-1] = (pi, pj, psize + size)
+                continue
+        merged.append((i, j, size))
+    return merged
+
+
+def _trim_region(a: Sequence, b: Sequence, alo: int, ahi: int, blo: int, bhi: int,
+                 blocks: List[MatchBlock]) -> Tuple[int, int, int, int]:
+    """Record the common prefix/suffix of a region and return what is left"""
+    start = alo
+    while alo < ahi and blo < bhi and a[alo] == b[blo]:
+        alo += 1
+        blo += 1
+    if alo > start:
+        blocks.append((start, blo - (alo - start), alo - start))
+    end = ahi
+    while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+        ahi -= 1
+        bhi -= 1
+    if ahi < end:
+        blocks.append((ahi, bhi, end - ahi))
+    return alo, ahi, blo, bhi
+
+
+def _middle_snake(a: Sequence, alo: int, ahi: int, b: Sequence, blo: int, bhi: int,
+                  check: Callable[[], None]) -> Tuple[int, int, int, int]:
+    """Find the middle snake of an edit path (Myers 1986, section 4b).
+
+    Returns absolute (x, y, u, v) such that a[x:u] == b[y:v] lies on an
+    optimal path. When that needs more than MYERS_MAX_D steps from either
+    end, returns the empty snake at the furthest point the forward search
+    reached, as GNU diff does for expensive regions: the diff is no longer
+    minimal, but both halves keep their matches. Both ends of the region
+    must already differ.
+    """
+    n = ahi - alo
+    m = bhi - blo
+    delta = n - m
+    odd = delta & 1
+    max_d = (n + m + 1) // 2
+    offset = max_d + 1
+    vf = [0] * (2 * offset + 1)
+    vb = [0] * (2 * offset + 1)
+    for d in range(max_d + 1):
+        if d > MYERS_MAX_D:
+            best = -1
+            for k in range(-(d - 1), d, 2):
+                x = vf[offset + k]
+                if x <= n and 0 <= x - k <= m and 2 * x - k > best:
+                    best = 2 * x - k
+                    x1, y1 = x, x - k
+            return alo + x1, blo + y1, alo + x1, blo + y1
+        check()
+        # Forward search from the top-left corner
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vf[offset + k - 1] < vf[offset + k + 1]):
+                x = vf[offset + k + 1]
+            else:
+                x = vf[offset + k - 1] + 1
+            y = x - k
+            x0, y0 = x, y
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x += 1
+                y += 1
+            vf[offset + k] = x
+            if odd and -(d - 1) <= delta - k <= d - 1:
+                if x + vb[offset + delta - k] >= n:
+                    return alo + x0, blo + y0, alo + x, blo + y
+        # Backward search from the bottom-right corner
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and vb[offset + k - 1] < vb[offset + k + 1]):
+                x = vb[offset + k + 1]
+            else:
+                x = vb[offset + k - 1] + 1
+            y = x - k
+            x0, y0 = x, y
+            while x < n and y < m and a[ahi - 1 - x] == b[bhi - 1 - y]:
+                x += 1
+                y += 1
+            vb[offset + k] = x
+            if not odd and -d <= delta - k <= d:
+                if x + vf[offset + delta - k] >= n:
+                    return ahi - x, bhi - y, ahi - x0, bhi - y0
+    raise AssertionError("no middle snake found")
+
+
+def _myers_region(a: Sequence, b: Sequence, alo: int, ahi: int, blo: int, bhi: int, check: Callable[[], None],
+                  blocks: List[MatchBlock]):
+    """Linear-space divide-and-conquer Myers diff of one region"""
+    stack = [(alo, ahi, blo, bhi)]
+    while stack:
+        check()
+        alo, ahi, blo, bhi = _trim_region(a, b, *stack.pop(), blocks)
+        if alo == ahi or blo == bhi:
+            continue
+        x, y, u, v = _middle_snake(a, alo, ahi, b, blo, bhi, check)
+        if u > x:
+            blocks.append((x, y, u - x))
+        stack.append((u, ahi, v, bhi))
+        stack.append((alo, x, blo, y))
+
+
+def _unique_anchors(a: Sequence, b: Sequence, alo: int, ahi: int,
+                    blo: int, bhi: int) -> List[Tuple[int, int]]:
+    """Lines unique on both sides of a region, longest increasing run (patience)"""
+    counts = {}
+    for i in range(alo, ahi):
+        entry = counts.get(a[i])
+        counts[a[i]] = [i, -1] if entry is None else [-1, -1]
+    for j in range(blo, bhi):
+        entry = counts.get(b[j])
+        if entry is not None and entry[0] >= 0:
+            entry[1] = j if entry[1] == -1 else -2
+    pairs = sorted((i, j) for i, j in counts.values() if i >= 0 and j >= 0)
+    if not pairs:
+        return []
+
+    # Patience sorting: longest increasing subsequence over the b positions
+    tails = []
+    tail_index = []
+    back = [-1] * len(pairs)
+    for idx, (_, j) in enumerate(pairs):
+        pos = bisect.bisect_left(tails, j)
+        if pos == len(tails):
+            tails.append(j)
+            tail_index.append(idx)
+        else:
+            tails[pos] = j
+            tail_index[pos] = idx
+        back[idx] = tail_index[pos - 1] if pos else -1
+    anchors = []
+    idx = tail_index[-1]
+    while idx >= 0:
+        anchors.append(pairs[idx])
+        idx = back[idx]
+    anchors.reverse()
+    return anchors
+
+
+def _patience_region(a: Sequence, b: Sequence, alo: int, ahi: int, blo: int, bhi: int, check: Callable[[], None],
+                     blocks: List[MatchBlock]):
+    """Patience diff: split on unique common lines, Myers where there are none"""
+    stack = [(alo, ahi, blo, bhi)]
+    while stack:
+        check()
+        alo, ahi, blo, bhi = _trim_region(a, b, *stack.pop(), blocks)
+        if alo == ahi or blo == bhi:
+            continue
+        anchors = _unique_anchors(a, b, alo, ahi, blo, bhi)
+        if not anchors:
+            _myers_region(a, b, alo, ahi, blo, bhi, check, blocks)
+            continue
+        prev_i, prev_j = alo, blo
+        for i, j in anchors:
+            blocks.append((i, j, 1))
+            stack.append((prev_i, i, prev_j, j))
+            prev_i, prev_j = i + 1, j + 1
+        stack.append((prev_i, ahi, prev_j, bhi))
+
+
+def _histogram_region(a: Sequence, b: Sequence, alo: int, ahi: int, blo: int, bhi: int, check: Callable[[], None],
+                      blocks: List[MatchBlock]):
+    """Histogram diff (as in git/JGit): split on the rarest common region"""
+    stack = [(alo, ahi, blo, bhi)]
+    while stack:
+        check()
+        alo, ahi, blo, bhi = _trim_region(a, b, *stack.pop(), blocks)
+        if alo == ahi or blo == bhi:
+            continue
+
+        occurrences = {}
+        for i in range(alo, ahi):
+            occurrences.setdefault(a[i], []).append(i)
+
+        best = None
+        best_count = HISTOGRAM_MAX_CHAIN + 1
+        best_size = 0
+        j = blo
+        while j < bhi:
+            if not (j - blo) % CHECK_INTERVAL:
+                check()
+            next_j = j + 1
+            positions = occurrences.get(b[j])
+            if positions is not None and len(positions) <= best_count:
+                for i in positions:
+                    # Grow the match in both directions
+                    si, sj = i, j
+                    while si > alo and sj > blo and a[si - 1] == b[sj - 1]:
+                        si -= 1
+                        sj -= 1
+                    ei, ej = i + 1, j + 1
+                    while ei < ahi and ej < bhi and a[ei] == b[ej]:
+                        ei += 1
+                        ej += 1
+                    count = min(len(occurrences[a[k]]) for k in range(si, ei))
+                    if count < best_count or (count == best_count and ei - si > best_size):
+                        best = (si, sj)
+                        best_count = count
+                        best_size = ei - si
+                    next_j = max(next_j, ej)
+            j = next_j
+
+        if best is None:
+            _myers_region(a, b, alo, ahi, blo, bhi, check, blocks)
+            continue
+        si, sj = best
+        blocks.append((si, sj, best_size))
+        stack.append((si + best_size, ahi, sj + best_size, bhi))
+        stack.append((alo, si, blo, sj))
+
+
+def _no_check():
+    pass
+
+
+def _region_opcodes(region_fn, a: Sequence, b: Sequence,
+                    check: Optional[Callable[[], None]]) -> List[Opcode]:
+    """Run a region diff function over both sequences and build opcodes"""
+    blocks = []
+    region_fn(a, b, 0, len(a), 0, len(b), check or _no_check, blocks)
+    return _opcodes_from_blocks(_merge_blocks(blocks), len(a), len(b))
+
+
+def _approximate_region(a: Sequence, b: Sequence, alo: int, ahi: int, blo: int, bhi: int,
+                        check: Callable[[], None], blocks: List[MatchBlock]):
+    """Patience split without the Myers fallback: a region with no unique common line stays one change"""
+    stack = [(alo, ahi, blo, bhi)]
+    while stack:
+        check()
+        alo, ahi, blo, bhi = _trim_region(a, b, *stack.pop(), blocks)
+        if alo == ahi or blo == bhi:
+            continue
+        prev_i, prev_j = alo, blo
+        for i, j in _unique_anchors(a, b, alo, ahi, blo, bhi):
+            blocks.append((i, j, 1))
+            stack.append((prev_i, i, prev_j, j))
+            prev_i, prev_j = i + 1, j + 1
+        if prev_i != alo:
+            stack.append((prev_i, ahi, prev_j, bhi))
+
+
+def myers_opcodes(a: Sequence, b: Sequence, check: Optional[Callable[[], None]] = None) -> List[Opcode]:
+    """Opcodes from the O(ND) linear-space Myers algorithm"""
+    return _region_opcodes(_myers_region, a, b, check)
+
+
+def patience_opcodes(a: Sequence, b: Sequence, check: Optional[Callable[[], None]] = None) -> List[Opcode]:
+    """Opcodes from patience diff"""
+    return _region_opcodes(_patience_region, a, b, check)
+
+
+def histogram_opcodes(a: Sequence, b: Sequence, check: Optional[Callable[[], None]] = None) -> List[Opcode]:
+    """Opcodes from histogram diff"""
+    return _region_opcodes(_histogram_region, a, b, check)
+
+
+def approximate_opcodes(a: Sequence, b: Sequence, check: Optional[Callable[[], None]] = None) -> List[Opcode]:
+    """Cheap opcodes anchored on unique common lines, used when the cost budget runs out"""
+    return _region_opcodes(_approximate_region, a, b, check)
+
+
+class _CheckedSequenceMatcher(difflib.SequenceMatcher):
+    """SequenceMatcher that calls check() before every longest-match search"""
+
+    def __init__(self, check: Callable[[], None], a: Sequence, b: Sequence):
+        self._check = check
+        super().__init__(None, a, b)
+
+    def find_longest_match(self, *args, **kwargs):
+        self._check()
+        return super().find_longest_match(*args, **kwargs)
+
+
+def sequencematcher_opcodes(a: Sequence, b: Sequence, check: Optional[Callable[[], None]] = None) -> List[Opcode]:
+    """Opcodes from difflib.SequenceMatcher (the original engine)"""
+    if check is None:
+        return difflib.SequenceMatcher(None, a, b).get_opcodes()
+    return _CheckedSequenceMatcher(check, a, b).get_opcodes()
+
+
+# Slice size used when scanning for the common prefix/suffix; whole slices
+# are compared in C before falling back to a per-item loop
+TRIM_CHUNK = 4096
+
+
+def _common_prefix(a: Sequence, b: Sequence) -> int:
+    """Length of the common prefix of two sequences"""
+    limit = min(len(a), len(b))
+    pos = 0
+    while pos + TRIM_CHUNK <= limit and a[pos:pos + TRIM_CHUNK] == b[pos:pos + TRIM_CHUNK]:
+        pos += TRIM_CHUNK
+    while pos < limit and a[pos] == b[pos]:
+        pos += 1
+    return pos
+
+
+def _common_suffix(a: Sequence, b: Sequence, limit: int) -> int:
+    """Length of the common suffix of two sequences, at most limit items"""
+    n = len(a)
+    m = len(b)
+    size = 0
+    while (size + TRIM_CHUNK <= limit and
+           a[n - size - TRIM_CHUNK:n - size] == b[m - size - TRIM_CHUNK:m - size]):
+        size += TRIM_CHUNK
+    while size < limit and a[n - size - 1] == b[m - size - 1]:
+        size += 1
+    return size
+
+
+# Bumped whenever a change alters the opcodes produced for the same input,
+# so results cached by older versions are not reused
+ENGINE_VERSION = 4
+
+# Bytes compared per step when checking for byte-identical files
+IDENTICAL_CHUNK = 1 << 20
+
+# Pairs smaller than this (combined) skip the result cache: diffing them is
+# cheaper than hashing both files and reading a cache entry
+CACHE_MIN_BYTES = 256 * 1024
+
+# Lines read from each file per step by DiffEngine.iter_compare_files
+STREAM_CHUNK_LINES = 10000
+
+# Pairs with fewer lines than this (after trimming the common prefix and
+# suffix) are diffed in-process even with DiffEngine(jobs=N): starting the
+# workers and sending them the lines would cost more than it saves
+PARALLEL_MIN_LINES = 100000
+
+# Segments per worker process, so one slow segment does not hold up the rest
+PARALLEL_SEGMENTS_PER_JOB = 4
+
+# Moved-block detection: shorter blocks stay deletes and inserts, and each
+# block start is tried against at most MOVE_MAX_CANDIDATES destinations
+MOVE_MIN_LINES = 3
+MOVE_MAX_CANDIDATES = 8
+
+
+# Available diff backends, selectable with DiffEngine(algorithm=...).
+# Each takes (a, b, check) where check() is called periodically and may raise
+ALGORITHMS: Dict[str, Callable[..., List[Opcode]]] = {
+    'difflib': sequencematcher_opcodes,
+    'myers': myers_opcodes,
+    'patience': patience_opcodes,
+    'histogram': histogram_opcodes,
+}
+DEFAULT_ALGORITHM = 'difflib'
+
+
+def _partition(a: Sequence, b: Sequence, segments: int) -> List[Tuple[int, int, int, int]]:
+    """Cut a and b into about segments regions that can be diffed independently.
+
+    Cuts are made at lines that are unique and matched in both sequences
+    (patience-style anchors); each anchor starts the region after the cut.
+    """
+    target = (len(a) + len(b)) // segments
+    regions = []
+    i0 = j0 = 0
+    for i, j in _unique_anchors(a, b, 0, len(a), 0, len(b)):
+        if (i - i0) + (j - j0) >= target:
+            regions.append((i0, i, j0, j))
+            i0, j0 = i, j
+    regions.append((i0, len(a), j0, len(b)))
+    return regions
+
+
+class _BudgetExceeded(Exception):
+    """Raised by a _Budget check once the exact diff has used up its budget"""
+
+
+class _Budget:
+    """check() hook that allows max_cost calls and runs until deadline (time.monotonic())"""
+
+    def __init__(self, max_cost: Optional[int], deadline: Optional[float]):
+        self.cost_left = max_cost
+        self.deadline = deadline
+
+    def __call__(self):
+        if self.cost_left is not None:
+            self.cost_left -= 1
+            if self.cost_left < 0:
+                raise _BudgetExceeded()
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise _BudgetExceeded()
+
+
+def _diff_segment(algorithm: str, a: Sequence, b: Sequence,
+                  max_cost: Optional[int], deadline: Optional[float]) -> Tuple[List[Opcode], bool]:
+    """Pool worker: opcodes of one region from _partition, and whether they are approximate"""
+    if max_cost is None and deadline is None:
+        return ALGORITHMS[algorithm](a, b), False
+    try:
+        return ALGORITHMS[algorithm](a, b, _Budget(max_cost, deadline)), False
+    except _BudgetExceeded:
+        return approximate_opcodes(a, b), True
+
+
+def _append_opcode(opcodes: List[Opcode], opcode: Opcode):
+    """Append opcode, merging it into a preceding 'equal' it continues"""
+    if opcode[0] == 'equal' and opcodes:
+        tag, i1, i2, j1, j2 = opcodes[-1]
+        if tag == 'equal' and i2 == opcode[1] and j2 == opcode[3]:
+            opcodes[-1] = ('equal', i1, opcode[2], j1, opcode[4])
+            return
+    opcodes.append(opcode)
+
+
+def _split_opcodes(opcodes: List[Opcode], start1: int, start2: int, stop1: int,
+                   stop2: int) -> Tuple[List[Opcode], List[Opcode]]:
+    """Opcodes before and after a changed window start1..stop1 / start2..stop2.
+
+    The head only covers lines before the window and the tail only lines
+    after it; both are cut inside 'equal' opcodes where possible, and
+    changes next to the window are dropped so it is re-diffed from and to
+    matched lines. Ends are non-decreasing, so both cuts are binary searches.
+    """
+    lo, hi = 0, len(opcodes)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if opcodes[mid][2] <= start1 and opcodes[mid][4] <= start2:
+            lo = mid + 1
+        else:
+            hi = mid
+    head = opcodes[:lo]
+    if lo < len(opcodes):
+        tag, i1, i2, j1, j2 = opcodes[lo]
+        keep = min(start1 - i1, start2 - j1)
+        if tag == 'equal' and i2 - i1 == j2 - j1 and keep > 0:
+            head.append(('equal', i1, i1 + keep, j1, j1 + keep))
+    while head and head[-1][0] != 'equal':
+        head.pop()
+
+    lo, hi = 0, len(opcodes)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if opcodes[mid][1] >= stop1 and opcodes[mid][3] >= stop2:
+            hi = mid
+        else:
+            lo = mid + 1
+    tail = opcodes[lo:]
+    if lo > 0:
+        tag, i1, i2, j1, j2 = opcodes[lo - 1]
+        keep = min(i2 - stop1, j2 - stop2)
+        if tag == 'equal' and i2 - i1 == j2 - j1 and keep > 0:
+            tail.insert(0, ('equal', i2 - keep, i2, j2 - keep, j2))
+    skip = 0
+    while skip < len(tail) and tail[skip][0] != 'equal':
+        skip += 1
+    return head, tail[skip:]
+
+
+def find_moves(lines1: Sequence[str], lines2: Sequence[str], opcodes: List[Opcode],
+               keys: Optional[Callable[[List[str]], List[str]]] = None,
+               min_lines: int = MOVE_MIN_LINES) -> List[Move]:
+    """Blocks of at least min_lines deleted lines that reappear among the inserted lines.
+
+    keys maps lines to what they are compared by (e.g. Normalizer.apply).
+    Every window of min_lines inserted lines that is not all blank is
+    indexed by its keys; the deleted lines are then scanned once, each
+    window hit is extended for as long as the lines keep matching, and the
+    longest extension is taken. Each destination line is used once, so the
+    pass is near-linear in the number of changed lines.
+    """
+    deleted = [(i1, i2) for tag, i1, i2, j1, j2 in opcodes
+               if tag in ('delete', 'replace') and i2 - i1 >= min_lines]
+    inserted = [(j1, j2) for tag, i1, i2, j1, j2 in opcodes
+                if tag in ('insert', 'replace') and j2 - j1 >= min_lines]
+    if not deleted or not inserted:
+        return []
+
+    # Window keys -> (inserted run, offset in the run) of each occurrence
+    index: Dict[tuple, List[Tuple[int, int]]] = {}
+    inserted_keys = []
+    for run, (j1, j2) in enumerate(inserted):
+        run_keys = keys(lines2[j1:j2]) if keys is not None else lines2[j1:j2]
+        inserted_keys.append(run_keys)
+        for offset in range(len(run_keys) - min_lines + 1):
+            window = tuple(run_keys[offset:offset + min_lines])
+            if all(not key or key.isspace() for key in window):
+                continue
+            index.setdefault(window, []).append((run, offset))
+    used = [bytearray(len(run_keys)) for run_keys in inserted_keys]
+
+    moves = []
+    for i1, i2 in deleted:
+        run_keys1 = keys(lines1[i1:i2]) if keys is not None else lines1[i1:i2]
+        count = len(run_keys1)
+        pos = 0
+        while pos + min_lines <= count:
+            best_size = 0
+            best = None
+            for run, offset in index.get(tuple(run_keys1[pos:pos + min_lines]), ())[:MOVE_MAX_CANDIDATES]:
+                run_keys2 = inserted_keys[run]
+                taken = used[run]
+                limit = min(count - pos, len(run_keys2) - offset)
+                size = 0
+                while (size < limit and not taken[offset + size] and
+                       run_keys1[pos + size] == run_keys2[offset + size]):
+                    size += 1
+                if size > best_size:
+                    best_size, best = size, (run, offset)
+            if best_size < min_lines:
+                pos += 1
+                continue
+            run, offset = best
+            used[run][offset:offset + best_size] = b'\x01' * best_size
+            j = inserted[run][0] + offset
+            moves.append((i1 + pos, i1 + pos + best_size, j, j + best_size))
+            pos += best_size
+    return moves
+
+
+class PreparedFile:
+    """A file read, normalized and interned once, to diff against many others.
+
+    Created by DiffEngine.prepare(); only valid with the comparison options
+    it was prepared with.
+    """
+
+    def __init__(self, path: str, size: int, digest: str, lines: List[str], keys: List[str],
+                 ids: Dict[str, int], key_ids: array, raw: bool, options: tuple):
+        self.path = path
+        self.size = size
+        # SHA-256 of the contents, for identity checks and cache keys
+        self.digest = digest
+        self.lines = lines
+        # Normalized lines (lines itself when nothing is normalized)
+        self.keys = keys
+        # Line index: every distinct key and its ID, and the IDs of keys
+        self.ids = ids
+        self.key_ids = key_ids
+        self.raw = raw
+        self.options = options
+
+
+# Engine and prepared file of a DiffEngine.compare_many() pool worker
+_many_engine: Optional['DiffEngine'] = None
+_many_prepared: Optional[PreparedFile] = None
+
+
+def _init_many_worker(engine_options: dict, prepared: PreparedFile):
+    """Pool initializer: receive the prepared file once per worker process"""
+    global _many_engine, _many_prepared
+    _many_engine = DiffEngine(**engine_options)
+    _many_prepared = prepared
+
+
+def _diff_many_target(target: str) -> tuple:
+    """Pool worker: (target, (opcodes, target lines or None if identical, approximate, moves)) or (target, error)"""
+    try:
+        result = _many_engine.diff_prepared(_many_prepared, target)
+    except Exception as e:
+        return target, e
+    # The parent already has the prepared lines
+    lines2 = None if result.lines2 is _many_prepared.lines else result.lines2
+    return target, (result.opcodes, lines2, result.approximate, result.moves)
+
+
+class DiffCancelled(Exception):
+    """Raised inside a comparison after DiffEngine.cancel() was called"""
+
+
+# progress(phase, done, total): phase is 'read' (bytes) or 'diff' (left-file lines)
+ProgressCallback = Callable[[str, int, int], None]
+
+
 class DiffEngine:
-    def __init__(self, ignore_whitespace: bool = False, context_lines: int = 3):
+    def __init__(self, ignore_whitespace: bool = False, context_lines: int = 3,
+                 algorithm: str = DEFAULT_ALGORITHM, cache=None,
+                 intraline: Optional[str] = 'word', progress: Optional[ProgressCallback] = None,
+                 timer: Optional[PhaseTimer] = None, ignore_case: bool = False,
+                 ignore_blank_lines: bool = False, ignore_trailing_cr: bool = False,
+                 masks: Sequence[str] = (), jobs: int = 1, max_cost: Optional[int] = None,
+                 timeout: Optional[float] = None, detect_moves: bool = True,
+                 prepared_cache: Optional[Dict] = None):
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown diff algorithm '{algorithm}' "
+                             f"(choose from {', '.join(sorted(ALGORITHMS))})")
+        if intraline is not None and intraline not in INTRALINE_MODES:
+            raise ValueError(f"Unknown intraline mode '{intraline}' "
+                             f"(choose from {', '.join(INTRALINE_MODES)})")
+        # Normalization options, see normalizers.Normalizer
         self.ignore_whitespace = ignore_whitespace
+        self.ignore_case = ignore_case
+        self.ignore_blank_lines = ignore_blank_lines
+        self.ignore_trailing_cr = ignore_trailing_cr
+        self.masks = tuple(masks)
+        # Fail on a bad mask here rather than in the middle of a comparison
+        self._normalizer()
         self.context_lines = context_lines
+        self.algorithm = algorithm
+        # Worker processes for large pairs (split at unique common lines)
+        self.jobs = jobs
+        # Budget for the exact diff of one comparison: max_cost check() calls of
+        # the backend (about one per edit-distance step or match search) and/or
+        # timeout seconds. Past it the diff is finished by approximate_opcodes().
+        self.max_cost = max_cost
+        self.timeout = timeout
+        # Whether to look for moved blocks among the deleted and inserted lines
+        self.detect_moves = detect_moves
+        # Whether the last comparison ran out of budget
+        self.approximate = False
+        self._budget: Optional[_Budget] = None
+        # Optional DiffCache used by diff_files
+        self.cache = cache
+        # Optional mapping that prepare() keeps PreparedFiles in, keyed by path,
+        # size, mtime and options, for a long-running process (diff_server)
+        self.prepared_cache = prepared_cache
+        # Granularity of the changed spans on REPLACE lines (None to disable)
+        self.intraline = intraline
+        self.progress = progress
+        # Optional PhaseTimer that records where the time goes
+        self.timer = timer
+        self._cancel_event = threading.Event()
+
+    def _start(self):
+        """Reset the per-comparison state: cancellation and the cost budget"""
+        self._cancel_event.clear()
+        self.approximate = False
+        self._budget = None
+        if self.max_cost is not None or self.timeout is not None:
+            deadline = time.monotonic() + self.timeout if self.timeout is not None else None
+            self._budget = _Budget(self.max_cost, deadline)
+
+    def cancel(self):
+        """Stop the running comparison (safe to call from another thread)"""
+        self._cancel_event.set()
+
+    def _check(self):
+        """Called periodically while comparing; raises DiffCancelled when cancelled"""
+        if self._cancel_event.is_set():
+            raise DiffCancelled("Comparison cancelled")
+
+    def _report(self, phase: str, done: int, total: int):
+        if self.progress is not None:
+            self.progress(phase, done, total)
+
+    def _phase(self, name: str):
+        return self.timer.phase(name) if self.timer is not None else nullcontext()
+
+    def _count(self, name: str, items: int):
+        if self.timer is not None:
+            self.timer.count(name, items)
 
-    def _preprocess_text(self, text: str) -> str:
-        """Preprocess text based on settings"""
-        if self.ignore_whitespace:
-            # Normalize whitespace
-            text = re.sub(r'\s+', ' ', text)
-            text = text.strip()
-        return text
+    def _normalizer(self) -> Normalizer:
+        """Normalizer for the current options (they may change between comparisons)"""
+        return Normalizer(self.ignore_whitespace, self.ignore_case, self.ignore_blank_lines,
+                          self.ignore_trailing_cr, self.masks)
+
+    def _compare_keys(self, lines: List[str], normalizer: Normalizer) -> List[str]:
+        """Normalized lines the diff runs on; results keep showing the original lines"""
+        if normalizer.is_identity:
+            return lines
+        with self._phase('preprocess'):
+            self._count('preprocess', len(lines))
+            return normalizer.apply(lines)
 
     def _read_file(self, filepath: str) -> List[str]:
         """Read file and return lines"""
+        with open(filepath, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                lines, _ = decode_lines(data)
+        return lines
+
+    def _read_raw_file(self, filepath: str) -> List[str]:
+        """Read file as Latin-1 lines that keep their endings (round-trips to the exact bytes)"""
+        with open(filepath, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return _raw_lines(data)
+
+    def _files_identical(self, file1: str, file2: str) -> bool:
+        """Cheap byte-level equality check done before any decoding"""
+        stat1 = os.stat(file1)
+        stat2 = os.stat(file2)
+        if stat1.st_size != stat2.st_size:
+            return False
+        if os.path.samestat(stat1, stat2) or stat1.st_size == 0:
+            return True
+        with open(file1, 'rb') as f1, open(file2, 'rb') as f2:
+            with mmap.mmap(f1.fileno(), 0, access=mmap.ACCESS_READ) as data1, \
+                    mmap.mmap(f2.fileno(), 0, access=mmap.ACCESS_READ) as data2:
+                for pos in range(0, stat1.st_size, IDENTICAL_CHUNK):
+                    if data1[pos:pos + IDENTICAL_CHUNK] != data2[pos:pos + IDENTICAL_CHUNK]:
+                        return False
+        return True
+
+    def _hash_file(self, filepath: str) -> str:
+        """SHA-256 of the file contents"""
+        with open(filepath, 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                return _sha256(b'')
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return _sha256(data)
+
+    def _worker_options(self) -> dict:
+        """Constructor arguments for an equivalent engine in a worker process"""
+        return {
+            'ignore_whitespace': self.ignore_whitespace,
+            'ignore_case': self.ignore_case,
+            'ignore_blank_lines': self.ignore_blank_lines,
+            'ignore_trailing_cr': self.ignore_trailing_cr,
+            'masks': self.masks,
+            'context_lines': self.context_lines,
+            'algorithm': self.algorithm,
+            'cache': self.cache,
+            'intraline': self.intraline,
+            'max_cost': self.max_cost,
+            'timeout': self.timeout,
+            'detect_moves': self.detect_moves,
+        }
+
+    def _cache_options(self) -> tuple:
+        """Everything besides the file contents that affects the opcodes"""
+        # Parallel results can differ from serial ones (anchors always match)
+        return (ENGINE_VERSION, self.algorithm, self.jobs > 1) + self._normalizer().options
+
+    def _intern_lines(self, *line_lists: List[str]) -> Tuple[array, ...]:
+        """Map every distinct line to a small integer ID (shared by all the lists)"""
+        ids = {}
+        return tuple(array('i', [ids.setdefault(line, len(ids)) for line in lines]) for lines in line_lists)
+
+    def _get_opcodes(self, keys1: Sequence, keys2: Sequence) -> List[Opcode]:
+        """Diff two key sequences, skipping the identical leading/trailing runs"""
+        n = len(keys1)
+        m = len(keys2)
+        prefix = _common_prefix(keys1, keys2)
+        suffix = _common_suffix(keys1, keys2, min(n, m) - prefix)
+
+        self._report('diff', prefix + suffix, n)
+
+        opcodes = []
+        if prefix:
+            opcodes.append(('equal', 0, prefix, 0, prefix))
+        if prefix < n - suffix or prefix < m - suffix:
+            a = keys1[prefix:n - suffix]
+            b = keys2[prefix:m - suffix]
+            if self.approximate:
+                # Budget used up earlier in this comparison (e.g. a previous --stream window)
+                middle = approximate_opcodes(a, b, self._check)
+            elif self.jobs > 1 and len(a) + len(b) >= PARALLEL_MIN_LINES:
+                middle = self._parallel_opcodes(a, b, prefix + suffix, n)
+            else:
+                middle = self._exact_opcodes(a, b)
+            for tag, i1, i2, j1, j2 in middle:
+                opcodes.append((tag, i1 + prefix, i2 + prefix, j1 + prefix, j2 + prefix))
+        if suffix:
+            opcodes.append(('equal', n - suffix, n, m - suffix, m))
+        self._report('diff', n, n)
+        return opcodes
+
+    def _exact_opcodes(self, a: Sequence, b: Sequence) -> List[Opcode]:
+        """Opcodes from the selected algorithm, or approximate ones once over budget"""
+        if self._budget is None:
+            return ALGORITHMS[self.algorithm](a, b, self._check)
+
+        def check():
+            self._check()
+            self._budget()
+
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            return [line.rstrip('\n\r') for line in lines]
-        except UnicodeDecodeError:
-            # Try with different encoding
-            with open(filepath, 'r', encoding='latin-1') as f:
-                lines = f.readlines()
-            return [line.rstrip('\n\r') for line in lines]
+            return ALGORITHMS[self.algorithm](a, b, check)
+        except _BudgetExceeded:
+            self.approximate = True
+            return approximate_opcodes(a, b, self._check)
+
+    def _parallel_opcodes(self, a: Sequence, b: Sequence, done: int, total: int) -> List[Opcode]:
+        """Diff a and b as independent segments (see _partition) across a process pool.
+
+        Anchor lines are always matched, so the result can differ slightly
+        from a serial diff with the same algorithm. done/total are the lines
+        already accounted for in progress reports.
+        """
+        regions = _partition(a, b, self.jobs * PARALLEL_SEGMENTS_PER_JOB)
+        if len(regions) == 1:
+            return self._exact_opcodes(a, b)
+        budget = self._budget or _Budget(None, None)
+        # Each worker gets an equal share of the cost budget and the same deadline
+        max_cost = None if budget.cost_left is None else max(budget.cost_left // len(regions), 0)
+
+        from concurrent.futures import ProcessPoolExecutor, wait
+        opcodes = []
+        with ProcessPoolExecutor(max_workers=min(self.jobs, len(regions))) as pool:
+            futures = [pool.submit(_diff_segment, self.algorithm, a[i1:i2], b[j1:j2], max_cost, budget.deadline)
+                       for i1, i2, j1, j2 in regions]
+            try:
+                for (i1, i2, j1, j2), future in zip(regions, futures):
+                    while wait([future], timeout=0.1).not_done:
+                        self._check()
+                    segment, approximate = future.result()
+                    self.approximate = self.approximate or approximate
+                    for tag, a1, a2, b1, b2 in segment:
+                        _append_opcode(opcodes, (tag, a1 + i1, a2 + i1, b1 + j1, b2 + j1))
+                    self._report('diff', done + i2, total)
+            except BaseException:
+                # Do not start the remaining segments
+                for future in futures:
+                    future.cancel()
+                raise
+        return opcodes
 
     def compare_files(self, file1: str, file2: str) -> Tuple[List[DiffLine], List[DiffLine]]:
         """Compare two files and return diff lines for each side"""
-        lines1 = self._read_file(file1)
-        lines2 = self._read_file(file2)
-        
-        return self.compare_lines(lines1, lines2)
+        return _split_rows(self.diff_files(file1, file2))
 
     def compare_lines(self, lines1: List[str], lines2: List[str]) -> Tuple[List[DiffLine], List[DiffLine]]:
         """Compare two lists of lines and return diff lines for each side"""
-        # Preprocess lines if needed
-        if self.ignore_whitespace:
-            lines1 = [self._preprocess_text(line) for line in lines1]
-            lines2 = [self._preprocess_text(line) for line in lines2]
+        return _split_rows(self.diff_lines(lines1, lines2))
 
-        # Use difflib to get opcodes
-        matcher = difflib.SequenceMatcher(None, lines1, lines2)
-        opcodes = matcher.get_opcodes()
+    def diff_files(self, file1: str, file2: str, raw: bool = False) -> DiffResult:
+        """Compare two files and return a compact DiffResult.
 
-        left_diff = []
-        right_diff = []
+        With raw=True lines are split on '\n' only and keep their endings as
+        Latin-1 text, so line ending changes count and the original bytes can
+        be written back (used for patch output). Results always hold the
+        original lines; normalization only affects what is compared.
+        """
+        self._start()
+        read_file = self._read_raw_file if raw else self._read_file
+        normalizer = self._normalizer()
+        size1 = os.path.getsize(file1)
+        total = size1 + os.path.getsize(file2)
+        with self._phase('identical'):
+            identical = self._files_identical(file1, file2)
+        if identical:
+            # Byte-identical: skip the diff, and decode one side only once rows are needed
+            with self._phase('read'):
+                lines = _FileLines(file1, read_file, raw)
+                self._count('read', len(lines))
+            self._report('read', total, total)
+            return DiffResult(lines, lines, [('equal', 0, len(lines), 0, len(lines))] if lines else [],
+                              self.intraline)
 
-        for tag, i1, i2, j1, j2 in opcodes:
-            if tag == 'equal':
-                # Lines are the same
-                for i, line_idx in enumerate(range(i1, i2)):
-                    left_diff.append(DiffLine(line_idx + 1, lines1[line_idx], DiffType.EQUAL))
-                    right_diff.append(DiffLine(j1 + i + 1, lines2[j1 + i], DiffType.EQUAL))
-            
-            elif tag == 'delete':
-                # Lines deleted from left
-                for line_idx in range(i1, i2):
-                    left_diff.append(DiffLine(line_idx + 1, lines1[line_idx], DiffType.DELETE))
-                # Add empty lines to right to maintain alignment
-                for _ in range(i2 - i1):
-                    right_diff.append(DiffLine(None, "", DiffType.DELETE))
-            
-            elif tag == 'insert':
-                # Lines inserted in right
-                for line_idx in range(j1, j2):
-                    right_diff.append(DiffLine(line_idx + 1, lines2[line_idx], DiffType.INSERT))
-                # Add empty lines to left to maintain alignment
-                for _ in range(j2 - j1):
-                    left_diff.append(DiffLine(None, "", DiffType.INSERT))
-            
-            elif tag == 'replace':
-                # Lines replaced
-                max_lines = max(i2 - i1, j2 - j1)
-                
-                # Add replaced lines
-                for i in range(max_lines):
-                    if i < (i2 - i1):
-                        left_diff.append(DiffLine(i1 + i + 1, lines1[i1 + i], DiffType.REPLACE))
-                    else:
-                        left_diff.append(DiffLine(None, "", DiffType.REPLACE))
-                    
-                    if i < (j2 - j1):
-                        right_diff.append(DiffLine(j1 + i + 1, lines2[j1 + i], DiffType.REPLACE))
-                    else:
-                        right_diff.append(DiffLine(None, "", DiffType.REPLACE))
-
-        return left_diff, right_diff
-
-    def get_stats(self, left_diff: List[DiffLine], right_diff: List[DiffLine]) -> dict:
-        """Get statistics about the diff"""
+        key = opcodes = None
+        if self.cache is not None and total >= CACHE_MIN_BYTES:
+            with self._phase('cache'):
+                key = self.cache.make_key(self._hash_file(file1), self._hash_file(file2),
+                                          self._cache_options() + (raw,))
+                opcodes = self.cache.get(key)
+
+        with self._phase('read'):
+            lines1 = read_file(file1)
+            self._report('read', size1, total)
+            self._check()
+            lines2 = read_file(file2)
+            self._report('read', total, total)
+            self._check()
+        self._count('read', len(lines1) + len(lines2))
+
+        if opcodes is not None:
+            return DiffResult(lines1, lines2, opcodes, self.intraline,
+                              moves=self._find_moves(lines1, lines2, opcodes, normalizer))
+
+        # The cache keeps the opcodes from before moved blocks are split out:
+        # moves are found again on every hit and may be turned off
+        opcodes = self._diff_keys(self._compare_keys(lines1, normalizer),
+                                  self._compare_keys(lines2, normalizer), normalizer)
+        result = DiffResult(lines1, lines2, opcodes, self.intraline, self.approximate,
+                            self._find_moves(lines1, lines2, opcodes, normalizer))
+        if key is not None and not result.approximate:
+            with self._phase('cache'):
+                self.cache.put(key, opcodes)
+        return result
+
+    def diff_lines(self, lines1: List[str], lines2: List[str]) -> DiffResult:
+        """Compare two lists of lines and return a compact DiffResult"""
+        self._start()
+        return self._diff_lines(lines1, lines2, self._normalizer())
+
+    def rediff(self, previous: DiffResult, lines1: List[str], lines2: List[str],
+               window1: Optional[Tuple[int, int, int]] = None,
+               window2: Optional[Tuple[int, int, int]] = None) -> DiffResult:
+        """Update previous for new versions of its files, re-diffing only what changed.
+
+        A window (start, old_stop, new_stop) says lines start..old_stop of
+        the old version became start..new_stop of the new one; without it
+        the window is found by comparing with previous.lines1/lines2, which
+        must then still hold the old lines. Opcodes outside the windows are
+        reused, so the work is proportional to the changed lines rather
+        than to the file sizes.
+        """
+        self._start()
+        normalizer = self._normalizer()
+        windows = []
+        for old, new, window in ((previous.lines1, lines1, window1), (previous.lines2, lines2, window2)):
+            if window is None:
+                start = _common_prefix(old, new)
+                size = _common_suffix(old, new, min(len(old), len(new)) - start)
+                window = (start, len(old) - size, len(new) - size)
+            windows.append(window)
+        (start1, stop1, new_stop1), (start2, stop2, new_stop2) = windows
+        head, tail = _split_opcodes(previous.opcodes, start1, start2, stop1, stop2)
+        lo1, lo2 = (head[-1][2], head[-1][4]) if head else (0, 0)
+        shift1 = new_stop1 - stop1
+        shift2 = new_stop2 - stop2
+        if tail:
+            hi1, hi2 = tail[0][1] + shift1, tail[0][3] + shift2
+        else:
+            hi1, hi2 = len(lines1), len(lines2)
+
+        keys1 = self._compare_keys(lines1[lo1:hi1], normalizer)
+        keys2 = self._compare_keys(lines2[lo2:hi2], normalizer)
+        opcodes = head
+        for tag, i1, i2, j1, j2 in self._diff_keys(keys1, keys2, normalizer):
+            _append_opcode(opcodes, (tag, i1 + lo1, i2 + lo1, j1 + lo2, j2 + lo2))
+        for tag, i1, i2, j1, j2 in tail:
+            _append_opcode(opcodes, (tag, i1 + shift1, i2 + shift1, j1 + shift2, j2 + shift2))
+        return DiffResult(lines1, lines2, opcodes, self.intraline, previous.approximate or self.approximate,
+                          self._find_moves(lines1, lines2, opcodes, normalizer))
+
+    def _diff_lines(self, lines1: List[str], lines2: List[str], normalizer: Normalizer) -> DiffResult:
+        keys1 = self._compare_keys(lines1, normalizer)
+        keys2 = self._compare_keys(lines2, normalizer)
+        opcodes = self._diff_keys(keys1, keys2, normalizer)
+        return DiffResult(lines1, lines2, opcodes, self.intraline, self.approximate,
+                          self._find_moves(lines1, lines2, opcodes, normalizer))
+
+    def _find_moves(self, lines1: List[str], lines2: List[str], opcodes: List[Opcode],
+                    normalizer: Normalizer) -> List[Move]:
+        if not self.detect_moves:
+            return []
+        with self._phase('moves'):
+            return find_moves(lines1, lines2, opcodes, None if normalizer.is_identity else normalizer.apply)
+
+    def _diff_keys(self, keys1: List[str], keys2: List[str], normalizer: Normalizer) -> List[Opcode]:
+        """Opcodes between two lists of normalized lines"""
+        blank1 = normalizer.blank_flags(keys1)
+        if blank1 is not None:
+            blank2 = normalizer.blank_flags(keys2)
+            if any(blank1) or any(blank2):
+                # Diff the non-blank lines, then put the blank lines back in between
+                index1 = [i for i, blank in enumerate(blank1) if not blank]
+                index2 = [j for j, blank in enumerate(blank2) if not blank]
+                opcodes = self._match_keys([keys1[i] for i in index1], [keys2[j] for j in index2])
+                return _expand_blank_gaps(opcodes, index1, index2, len(keys1), len(keys2))
+        return self._match_keys(keys1, keys2)
+
+    def _match_keys(self, keys1: List[str], keys2: List[str]) -> List[Opcode]:
+        # Intern lines to integer IDs and diff those
+        with self._phase('intern'):
+            ids1, ids2 = self._intern_lines(keys1, keys2)
+        self._count('intern', len(ids1) + len(ids2))
+        self._check()
+        with self._phase('match'):
+            opcodes = self._get_opcodes(ids1, ids2)
+        self._count('match', len(ids1) + len(ids2))
+        return opcodes
+
+    def compare3(self, base_file: str, ours_file: str, theirs_file: str, raw: bool = False):
+        """Three-way compare of ours and theirs against base; returns a merge3.Merge3Result.
+
+        With raw=True files are read as raw lines (see diff_files), so the
+        merged text keeps the original bytes and line endings.
+        """
+        self._start()
+        read_file = self._read_raw_file if raw else self._read_file
+        with self._phase('read'):
+            lines = [read_file(path) for path in (base_file, ours_file, theirs_file)]
+            self._check()
+        self._count('read', sum(map(len, lines)))
+        return self._compare3(*lines, raw=raw)
+
+    def compare3_lines(self, base: List[str], ours: List[str], theirs: List[str]):
+        """Three-way compare of lists of lines; returns a merge3.Merge3Result"""
+        self._start()
+        return self._compare3(base, ours, theirs)
+
+    def _compare3(self, base: List[str], ours: List[str], theirs: List[str], raw: bool = False):
+        # Imported here: merge3 builds on this module
+        from merge3 import Merge3Result, merge_regions
+        # Blank lines are compared as they are: a merge has to keep them
+        normalizer = self._normalizer()
+        keys = [self._compare_keys(lines, normalizer) for lines in (base, ours, theirs)]
+        # One interning pass, so the base IDs are shared by both diffs
+        with self._phase('intern'):
+            base_ids, ours_ids, theirs_ids = self._intern_lines(*keys)
+        self._count('intern', len(base_ids) + len(ours_ids) + len(theirs_ids))
+        self._check()
+        with self._phase('match'):
+            ours_opcodes = self._get_opcodes(base_ids, ours_ids)
+            theirs_opcodes = self._get_opcodes(base_ids, theirs_ids)
+        self._count('match', 2 * len(base_ids) + len(ours_ids) + len(theirs_ids))
+        with self._phase('merge'):
+            regions = merge_regions(base_ids, ours_ids, theirs_ids, ours_opcodes, theirs_opcodes)
+        return Merge3Result(base, ours, theirs, regions, raw, self.approximate)
+
+    def prepare(self, filepath: str, raw: bool = False) -> PreparedFile:
+        """Read, hash, normalize and index a file once, to diff against many others"""
+        self._start()
+        normalizer = self._normalizer()
+        cache_key = None
+        if self.prepared_cache is not None:
+            st = os.stat(filepath)
+            cache_key = (os.path.abspath(filepath), st.st_size, st.st_mtime_ns, raw, normalizer.options)
+            prepared = self.prepared_cache.get(cache_key)
+            if prepared is not None:
+                return prepared
+        # Map the file once: the lines and the digest come from the same bytes
+        with open(filepath, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else nullcontext(b'') as data:
+                with self._phase('read'):
+                    lines = _raw_lines(data) if raw else decode_lines(data)[0]
+                self._count('read', len(lines))
+                with self._phase('identical'):
+                    digest = _sha256(data)
+        keys = self._compare_keys(lines, normalizer)
+        with self._phase('intern'):
+            ids = {}
+            key_ids = array('i', [ids.setdefault(key, len(ids)) for key in keys])
+        self._count('intern', len(key_ids))
+        prepared = PreparedFile(filepath, size, digest, lines, keys, ids, key_ids, raw, normalizer.options)
+        if cache_key is not None:
+            self.prepared_cache[cache_key] = prepared
+        return prepared
+
+    def diff_prepared(self, prepared: PreparedFile, file2: str) -> DiffResult:
+        """Compare a prepared file with file2, reusing its lines, keys and line index"""
+        self._start()
+        normalizer = self._normalizer()
+        if prepared.options != normalizer.options:
+            raise ValueError(f"'{prepared.path}' was prepared with different comparison options")
+        size2 = os.path.getsize(file2)
+        use_cache = self.cache is not None and prepared.size + size2 >= CACHE_MIN_BYTES
+        digest2 = None
+        if size2 == prepared.size or use_cache:
+            with self._phase('identical'):
+                digest2 = self._hash_file(file2)
+        if size2 == prepared.size and digest2 == prepared.digest:
+            lines = prepared.lines
+            return DiffResult(lines, lines, [('equal', 0, len(lines), 0, len(lines))] if lines else [],
+                              self.intraline)
+
+        key = opcodes = None
+        if use_cache:
+            with self._phase('cache'):
+                key = self.cache.make_key(prepared.digest, digest2, self._cache_options() + (prepared.raw,))
+                opcodes = self.cache.get(key)
+
+        with self._phase('read'):
+            lines2 = self._read_raw_file(file2) if prepared.raw else self._read_file(file2)
+        self._count('read', len(lines2))
+        self._check()
+        if opcodes is not None:
+            return DiffResult(prepared.lines, lines2, opcodes, self.intraline,
+                              moves=self._find_moves(prepared.lines, lines2, opcodes, normalizer))
+
+        keys2 = self._compare_keys(lines2, normalizer)
+        if normalizer.ignore_blank_lines:
+            opcodes = self._diff_keys(prepared.keys, keys2, normalizer)
+        else:
+            with self._phase('intern'):
+                # Extend a copy of the prepared index; copying skips rehashing its keys
+                ids = dict(prepared.ids)
+                ids2 = array('i', [ids.setdefault(key, len(ids)) for key in keys2])
+            self._count('intern', len(ids2))
+            self._check()
+            with self._phase('match'):
+                opcodes = self._get_opcodes(prepared.key_ids, ids2)
+            self._count('match', len(prepared.key_ids) + len(ids2))
+        result = DiffResult(prepared.lines, lines2, opcodes, self.intraline, self.approximate,
+                            self._find_moves(prepared.lines, lines2, opcodes, normalizer))
+        if key is not None and not result.approximate:
+            with self._phase('cache'):
+                self.cache.put(key, opcodes)
+        return result
+
+    def compare_many(self, base: Union[str, PreparedFile], targets: Sequence[str],
+                     jobs: int = 1) -> Iterator[Tuple[str, Union[DiffResult, Exception]]]:
+        """Compare base with each target, preparing base only once.
+
+        Yields (target, DiffResult) as each comparison finishes, or (target,
+        exception) for a target that could not be compared. With jobs > 1 the
+        targets are diffed in a process pool; each worker receives the
+        prepared base once.
+        """
+        prepared = base if isinstance(base, PreparedFile) else self.prepare(base)
+        if jobs <= 1 or len(targets) <= 1:
+            for target in targets:
+                try:
+                    result = self.diff_prepared(prepared, target)
+                except DiffCancelled:
+                    raise
+                except Exception as e:
+                    yield target, e
+                    continue
+                yield target, result
+            return
+
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        with ProcessPoolExecutor(max_workers=min(jobs, len(targets)), initializer=_init_many_worker,
+                                 initargs=(self._worker_options(), prepared)) as pool:
+            futures = [pool.submit(_diff_many_target, target) for target in targets]
+            try:
+                for future in as_completed(futures):
+                    self._check()
+                    target, outcome = future.result()
+                    if isinstance(outcome, Exception):
+                        yield target, outcome
+                        continue
+                    opcodes, lines2, approximate, moves = outcome
+                    yield target, DiffResult(prepared.lines, prepared.lines if lines2 is None else lines2,
+                                             opcodes, self.intraline, approximate, moves)
+            except BaseException:
+                # Do not start the remaining targets
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def _iter_file_lines(self, filepath: str) -> Iterator[str]:
+        """Yield the lines of a file without loading it whole"""
+        with open(filepath, 'r', encoding='utf-8', errors='surrogateescape') as f:
+            for line in f:
+                line = line.rstrip('\n\r')
+                if not line.isascii():
+                    try:
+                        line.encode('utf-8')
+                    except UnicodeEncodeError:
+                        # Not valid UTF-8, fall back to Latin-1 for this line
+                        line = line.encode('utf-8', 'surrogateescape').decode('latin-1')
+                yield line
+
+    def iter_compare_files(self, file1: str, file2: str,
+                           chunk_lines: int = STREAM_CHUNK_LINES) -> Iterator[Tuple[DiffLine, DiffLine]]:
+        """Compare two files in bounded memory, yielding aligned (left, right) rows.
+
+        Both files are read chunk_lines at a time. Each window is cut after the
+        last line that is unique and matched in both buffers (patience-style
+        anchor); everything before it is diffed and emitted, the rest stays
+        buffered. Windows only grow while no anchor is found, so memory is
+        bounded by the largest change region rather than by the file size.
+        Anchors are only unique within the window, so the result can differ
+        slightly from a whole-file compare.
+        """
+        self._start()
+        normalizer = self._normalizer()
+        reader1 = self._iter_file_lines(file1)
+        reader2 = self._iter_file_lines(file2)
+        # Original lines, and the normalized keys they are compared by
+        buf1 = []
+        buf2 = []
+        keys1 = []
+        keys2 = []
+        base1 = base2 = 0
+        eof1 = eof2 = False
+        window = chunk_lines
+
+        while True:
+            self._check()
+            # Top up both buffers
+            while not eof1 and len(buf1) < window:
+                line = next(reader1, None)
+                if line is None:
+                    eof1 = True
+                else:
+                    buf1.append(line)
+                    keys1.append(normalizer(line))
+            while not eof2 and len(buf2) < window:
+                line = next(reader2, None)
+                if line is None:
+                    eof2 = True
+                else:
+                    buf2.append(line)
+                    keys2.append(normalizer(line))
+
+            if (eof1 and eof2) or (eof1 and not buf1) or (eof2 and not buf2):
+                # Nothing left to resynchronize against
+                cut1, cut2 = len(buf1), len(buf2)
+            else:
+                prefix = _common_prefix(keys1, keys2)
+                if prefix:
+                    cut1 = cut2 = prefix
+                else:
+                    anchors = _unique_anchors(keys1, keys2, 0, len(keys1), 0, len(keys2))
+                    if not anchors:
+                        # Change region is larger than the window
+                        window += chunk_lines
+                        continue
+                    cut1, cut2 = anchors[-1]
+                    cut1 += 1
+                    cut2 += 1
+
+            lines1 = buf1[:cut1]
+            lines2 = buf2[:cut2]
+            for opcode in self._diff_keys(keys1[:cut1], keys2[:cut2], normalizer):
+                _, i1, i2, j1, j2 = opcode
+                yield from _iter_opcode_rows(opcode, lines1, lines2, 0, max(i2 - i1, j2 - j1),
+                                             base1, base2, self.intraline)
+            del buf1[:cut1]
+            del buf2[:cut2]
+            del keys1[:cut1]
+            del keys2[:cut2]
+            base1 += cut1
+            base2 += cut2
+            window = chunk_lines
+
+            if eof1 and eof2 and not buf1 and not buf2:
+                return
+
+    def get_stats(self, left_diff: Union[DiffResult, List[DiffLine]],
+                  right_diff: Optional[List[DiffLine]] = None) -> dict:
+        """Get statistics about the diff (from a DiffResult or the two row lists)"""
+        if isinstance(left_diff, DiffResult):
+            return left_diff.stats()
         stats = {
-            'total_lines_left': len([line for line in left_diff if line.line_num is not None]),
-            'total_lines_right': len([line for line in right_diff if line.line_num is not None]),
-            'added_lines': len([line for line in right_diff if line.diff_type == DiffType.INSERT]),
-            'deleted_lines': len([line for line in left_diff if line.diff_type == DiffType.DELETE]),
-            'changed_lines': len([line for line in left_diff if line.diff_type == DiffType.REPLACE]),
-            'unchanged_lines': len([line for line in left_diff if line.diff_type == DiffType.EQUAL]),
+            'total_lines_left': 0,
+            'total_lines_right': 0,
+            'added_lines': 0,
+            'deleted_lines': 0,
+            'changed_lines': 0,
+            'unchanged_lines': 0,
+            'moved_lines': 0,
+            'approximate': self.approximate,
         }
+        # One pass over the rows; DELETE/REPLACE/EQUAL are read from the left
+        # side and INSERT from the right, like the padded rows are built.
+        # Moves are counted at their source.
+        for left_line, right_line in zip(left_diff, right_diff):
+            if left_line.line_num is not None:
+                stats['total_lines_left'] += 1
+            if right_line.line_num is not None:
+                stats['total_lines_right'] += 1
+            if left_line.diff_type == DiffType.EQUAL:
+                stats['unchanged_lines'] += 1
+            elif left_line.diff_type == DiffType.DELETE:
+                stats['deleted_lines'] += 1
+            elif left_line.diff_type == DiffType.REPLACE:
+                stats['changed_lines'] += 1
+            elif left_line.diff_type == DiffType.MOVE:
+                stats['moved_lines'] += 1
+            if right_line.diff_type == DiffType.INSERT:
+                stats['added_lines'] += 1
         return stats
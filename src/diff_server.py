@@ -0,0 +1,342 @@
+"""Comparison server for editor integrations and hooks (cdiff --serve).
+
+One long-running process keeps the modules imported and the prepared-file
+and result caches warm behind a local socket (a named pipe on Windows).
+cdiff forwards its arguments when a server is running and prints the
+reply, so a run costs a connect instead of an interpreter start-up.
+
+Each request is one JSON message, answered by two: the server takes the
+request up, then sends the reply once the comparison is done.
+
+    {"version": 2, "key": "...", "argv": [...], "cwd": "...", "color": true, "encoding": "utf-8"}
+    {"version": 2}
+    {"version": 2, "exit": 0, "stdout": "...", "stderr": "..."}
+
+Each message is sent as its length (8 bytes, big-endian) and the bytes;
+on Windows the named pipe keeps messages apart. Output is carried as
+Latin-1 text of the raw bytes, so unified and merge output arrive byte for
+byte. Requests carry a random key that only the user can read.
+
+Requests are served one at a time. A client whose request is not taken up
+within ACCEPT_TIMEOUT, because the server is busy or stuck, compares
+in-process instead. Runs that keep going or report as they go (--watch,
+--stream, --progress) are refused and also run in-process; a reply without
+an exit code says so.
+
+Kept free of heavy imports: forward() runs before cdiff loads anything else,
+and only loads json once a key file says a server is running.
+"""
+import io
+import os
+import struct
+import sys
+from collections import OrderedDict
+from typing import List, Optional
+
+from diff_cache import default_cache_dir
+
+# Bumped when requests or replies change; clients that do not match run in-process
+PROTOCOL_VERSION = 2
+
+# Reference files kept prepared between --against-many requests
+PREPARED_CACHE_FILES = 8
+
+# Arguments that are never forwarded: they start the server, keep running or
+# write output as they go. The server checks the parsed arguments again.
+LOCAL_ONLY_ARGUMENTS = ("--serve", "--no-server", "--watch", "--stream", "--progress")
+
+# Seconds a client waits to connect and for its request to be taken up
+ACCEPT_TIMEOUT = 1.0
+
+# Seconds the server waits on a client to send its request or read the reply
+CLIENT_TIMEOUT = 5.0
+
+
+def server_address() -> str:
+    """Named pipe (Windows) or Unix socket path of this user's server"""
+    if sys.platform == 'win32':
+        return r'\\.\pipe\wdiff-' + os.environ.get('USERNAME', 'user')
+    return os.path.join(default_cache_dir(), 'server.sock')
+
+
+def _key_path() -> str:
+    return os.path.join(default_cache_dir(), 'server.key')
+
+
+class _SocketConnection:
+    """send_bytes()/recv_bytes() over a Unix socket, like a multiprocessing Connection"""
+
+    def __init__(self, sock):
+        self.sock = sock
+
+    def send_bytes(self, data: bytes):
+        self.sock.sendall(struct.pack('!Q', len(data)) + data)
+
+    def recv_bytes(self) -> bytes:
+        size, = struct.unpack('!Q', self._recv_exactly(8))
+        return self._recv_exactly(size)
+
+    def _recv_exactly(self, size: int) -> bytes:
+        data = bytearray(size)
+        view = memoryview(data)
+        received = 0
+        while received < size:
+            count = self.sock.recv_into(view[received:])
+            if not count:
+                raise EOFError
+            received += count
+        return bytes(data)
+
+    def poll(self, timeout: float) -> bool:
+        """Whether there is something to read (or the server hung up) within timeout seconds"""
+        import select
+        return bool(select.select([self.sock], [], [], timeout)[0])
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _connect(address: str):
+    if sys.platform == 'win32':
+        from multiprocessing.connection import Client
+        return Client(address)
+    # The C module: the socket wrapper's imports (enum, selectors) would slow every forwarded run
+    import _socket
+    sock = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+    try:
+        # A server that stopped accepting would otherwise leave connect() waiting
+        sock.settimeout(ACCEPT_TIMEOUT)
+        sock.connect(address)
+        sock.settimeout(None)
+    except OSError:
+        sock.close()
+        raise
+    return _SocketConnection(sock)
+
+
+def _is_local_only(arg: str) -> bool:
+    """Whether arg is one of LOCAL_ONLY_ARGUMENTS or an abbreviation argparse would accept"""
+    name = arg.split("=")[0]
+    return len(name) > 2 and name.startswith("--") and any(
+        option.startswith(name) for option in LOCAL_ONLY_ARGUMENTS)
+
+
+def _runs_locally(args) -> bool:
+    """Whether parsed cdiff arguments keep running or write output as they go"""
+    return args.serve or args.no_server or args.watch is not None or args.stream or args.progress
+
+
+class _LRUCache(OrderedDict):
+    """Mapping that keeps only the max_items most recently used entries"""
+
+    def __init__(self, max_items: int):
+        super().__init__()
+        self.max_items = max_items
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        self.move_to_end(key)
+        return self[key]
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.max_items:
+            self.popitem(last=False)
+
+
+def forward(argv: List[str]) -> Optional[int]:
+    """Run cdiff with argv in the server; returns its exit code, or None to run in-process.
+
+    None means there is no usable server: none running, a stale key or
+    socket, a different protocol version, or arguments that must run here.
+    """
+    if any(_is_local_only(arg) for arg in argv):
+        return None
+    try:
+        with open(_key_path(), 'rb') as f:
+            key = f.read()
+        conn = _connect(server_address())
+    except OSError:
+        return None
+    import json
+    request = {
+        'version': PROTOCOL_VERSION,
+        'key': key.hex(),
+        'argv': argv,
+        'cwd': os.getcwd(),
+        # Colors are stripped when not writing to a terminal, as in-process
+        'color': sys.stdout.isatty(),
+        'encoding': sys.stdout.encoding,
+        'errors': sys.stdout.errors,
+    }
+    try:
+        with conn:
+            conn.send_bytes(json.dumps(request).encode('utf-8'))
+            # Busy with another request (or stuck): do not wait behind it
+            if not conn.poll(ACCEPT_TIMEOUT):
+                return None
+            if json.loads(conn.recv_bytes()).get('version') != PROTOCOL_VERSION:
+                return None
+            reply = json.loads(conn.recv_bytes())
+    except (EOFError, OSError, ValueError):
+        # Server went away or refused the key; comparisons have no side effects, so redo it here
+        return None
+    if reply.get('version') != PROTOCOL_VERSION or 'exit' not in reply:
+        return None
+
+    stdout = reply['stdout'].encode('latin-1')
+    if sys.platform == 'win32' and b'\x1b' in stdout:
+        try:
+            from colorama import just_fix_windows_console
+            just_fix_windows_console()
+        except ImportError:
+            pass
+    sys.stdout.flush()
+    sys.stdout.buffer.write(stdout)
+    sys.stdout.buffer.flush()
+    sys.stderr.flush()
+    sys.stderr.buffer.write(reply['stderr'].encode('latin-1'))
+    sys.stderr.buffer.flush()
+    return reply['exit']
+
+
+def _handle(request: dict, prepared_cache: _LRUCache) -> dict:
+    """Run one forwarded cdiff command with its output captured.
+
+    Replies without an exit code (the client then runs the command itself)
+    for another protocol version and for arguments that must run locally.
+    """
+    if request.get('version') != PROTOCOL_VERSION:
+        return {'version': PROTOCOL_VERSION}
+    from cli import parse_args, run, use_color
+
+    argv = list(request['argv'])
+    if not request.get('color'):
+        argv.insert(0, '--no-color')
+    out = io.BytesIO()
+    err = io.BytesIO()
+    stdout = io.TextIOWrapper(out, encoding=request.get('encoding') or 'utf-8',
+                              errors=request.get('errors') or 'strict', write_through=True)
+    stderr = io.TextIOWrapper(err, encoding=request.get('encoding') or 'utf-8',
+                              errors='backslashreplace', write_through=True)
+    saved = sys.stdout, sys.stderr, os.getcwd()
+    sys.stdout, sys.stderr = stdout, stderr
+    try:
+        os.chdir(request['cwd'])
+        try:
+            args = parse_args(argv)
+            if _runs_locally(args):
+                return {'version': PROTOCOL_VERSION}
+            # Never colorama's init(): it would wrap the server's own stdout
+            use_color(not args.no_color)
+            exit_code = run(args, prepared_cache=prepared_cache)
+        except SystemExit as e:
+            # argparse errors and --help
+            exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            if not isinstance(e.code, (int, type(None))):
+                print(e.code, file=sys.stderr)
+        except Exception as e:
+            print(f"Error: {e}", file=sys.stderr)
+            exit_code = 2
+        stdout.flush()
+        stderr.flush()
+    finally:
+        sys.stdout, sys.stderr = saved[:2]
+        os.chdir(saved[2])
+    return {'version': PROTOCOL_VERSION, 'exit': exit_code,
+            'stdout': out.getvalue().decode('latin-1'), 'stderr': err.getvalue().decode('latin-1')}
+
+
+def _listen(address: str):
+    """Listening socket or named pipe on address; returns (accept, close)"""
+    if sys.platform == 'win32':
+        from multiprocessing.connection import Listener
+        listener = Listener(address, backlog=16)
+        return listener.accept, listener.close
+    import socket
+    os.makedirs(os.path.dirname(address), exist_ok=True)
+    if os.path.exists(address):
+        try:
+            _connect(address).close()
+        except OSError:
+            # Left behind by a server that did not shut down cleanly
+            os.unlink(address)
+        else:
+            raise OSError("a server is already running")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(address)
+    os.chmod(address, 0o600)
+    sock.listen(16)
+
+    def accept():
+        conn = sock.accept()[0]
+        # A client that stalls must not hold up the requests queued behind it
+        conn.settimeout(CLIENT_TIMEOUT)
+        return _SocketConnection(conn)
+
+    def close():
+        sock.close()
+        os.unlink(address)
+
+    return accept, close
+
+
+def serve() -> int:
+    """Serve forwarded cdiff runs one at a time until interrupted; returns the exit code"""
+    import hmac
+    import json
+    # Warm up everything a request needs before the first one arrives
+    import cli  # noqa: F401
+
+    address = server_address()
+    try:
+        accept, close = _listen(address)
+    except OSError as e:
+        print(f"Error: cannot listen on {address}: {e}", file=sys.stderr)
+        return 2
+
+    # Written once listening, so clients never find a key without a server
+    key = os.urandom(32)
+    key_path = _key_path()
+    os.makedirs(os.path.dirname(key_path), exist_ok=True)
+    fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(key)
+    print(f"Serving on {address} (Ctrl+C to stop)", file=sys.stderr, flush=True)
+
+    prepared_cache = _LRUCache(PREPARED_CACHE_FILES)
+    try:
+        while True:
+            try:
+                conn = accept()
+            except OSError:
+                continue
+            with conn:
+                try:
+                    if not conn.poll(CLIENT_TIMEOUT):
+                        continue
+                    request = json.loads(conn.recv_bytes())
+                    if not hmac.compare_digest(str(request.get('key')), key.hex()):
+                        # Hang up: the client compares in-process instead
+                        continue
+                    # Taken up: the client now waits for the reply however long the comparison takes
+                    conn.send_bytes(json.dumps({'version': PROTOCOL_VERSION}).encode('utf-8'))
+                    conn.send_bytes(json.dumps(_handle(request, prepared_cache)).encode('utf-8'))
+                except (EOFError, OSError, ValueError, AttributeError):
+                    continue
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        try:
+            os.unlink(key_path)
+        except OSError:
+            pass
+        close()
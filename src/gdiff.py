@@ -6,10 +6,11 @@ GUI Diff Tool - Graphical file comparison with optional file arguments
 import sys
 import argparse
 import os
-from pathlib import Path
 
 # Add src directory to path so we can import modules
-sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from options import add_compare_arguments, add_file_arguments, engine_arguments, resolve_path
 
 def main():
     """Main entry point for gdiff command"""
@@ -20,14 +21,14 @@ def main():
 Examples:
   gdiff                               # Launch GUI with file browser
   gdiff file1.txt file2.txt          # Launch GUI with files pre-selected
+  gdiff -w -a histogram a.txt b.txt  # Same comparison options as cdiff
+
+Output options (--format, --width, --stream and so on) only apply to cdiff.
         """
     )
     
-    parser.add_argument("file1", nargs="?", help="First file to compare (optional)")
-    parser.add_argument("file2", nargs="?", help="Second file to compare (optional)")
-    parser.add_argument("-w", "--ignore-whitespace", action="store_true", 
-                       help="Ignore whitespace differences (pre-set in GUI)")
-    parser.add_argument("--user-dir", help="Original user working directory for relative path resolution")
+    add_file_arguments(parser, optional=True)
+    add_compare_arguments(parser)
     
     args = parser.parse_args()
     
@@ -39,24 +40,8 @@ Examples:
     
     # Convert relative paths to absolute paths
     # Use user directory if provided, otherwise use current directory
-    base_dir = args.user_dir if args.user_dir else os.getcwd()
-    
-    file1 = None
-    file2 = None
-    
-    if args.file1:
-        if os.path.isabs(args.file1):
-            file1 = args.file1
-        else:
-            file1 = os.path.join(base_dir, args.file1)
-        file1 = os.path.abspath(file1)
-    
-    if args.file2:
-        if os.path.isabs(args.file2):
-            file2 = args.file2
-        else:
-            file2 = os.path.join(base_dir, args.file2)
-        file2 = os.path.abspath(file2)
+    file1 = resolve_path(args.file1, args.user_dir)
+    file2 = resolve_path(args.file2, args.user_dir)
     
     # Check if files exist
     if file1 and not os.path.exists(file1):
@@ -67,7 +52,13 @@ Examples:
         print(f"Error: File '{args.file2}' not found", file=sys.stderr)
         sys.exit(1)
     
+    base = resolve_path(args.merge, args.user_dir)
+    if base and not os.path.exists(base):
+        print(f"Error: File '{args.merge}' not found", file=sys.stderr)
+        sys.exit(1)
+    
     try:
+        from diff_engine import DiffEngine
         from gui import DiffGUI
         import tkinter as tk
         
@@ -75,6 +66,15 @@ Examples:
         root = tk.Tk()
         app = DiffGUI(root)
         
+        # Comparison options; the ones the GUI has controls for are pre-set there
+        app.engine = DiffEngine(**engine_arguments(args))
+        app.ignore_whitespace_var.set(args.ignore_whitespace)
+        app.ignore_case_var.set(args.ignore_case)
+        app.ignore_blank_lines_var.set(args.ignore_blank_lines)
+        app.watch_var.set(args.watch is not None)
+        if base:
+            app.base_var.set(base)
+        
         # Pre-populate files if provided
         if file1 and file2:
             app.file1_var.set(file1)
@@ -82,10 +82,6 @@ Examples:
             app.file1_path = file1
             app.file2_path = file2
             
-            # Set ignore whitespace if specified
-            if args.ignore_whitespace:
-                app.ignore_whitespace_var.set(True)
-            
             # Automatically compare files
             app.compare_files()
         
@@ -1,8 +1,21 @@
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox, scrolledtext
+from tkinter import ttk, filedialog, messagebox
+import tkinter.font as tkfont
 import os
-from typing import List, Optional
-from diff_engine import DiffEngine, DiffLine, DiffType
+import queue
+import threading
+from typing import Optional, Union
+from diff_engine import DiffCancelled, DiffEngine, DiffLine, DiffResult, DiffType
+from merge3 import Merge3Result
+from phase_timer import PhaseTimer
+from watch import POLL_INTERVAL, WatchedPair
+
+# Rows rendered above and below the visible area; scrolling within them
+# does not re-render
+RENDER_BUFFER = 50
+
+# How often the Tk thread polls the comparison worker (ms)
+POLL_INTERVAL_MS = 100
 
 class DiffGUI:
     def __init__(self, root):
@@ -17,13 +30,36 @@ class DiffGUI:
         self.file1_path = ""
         self.file2_path = ""
         
+        # Virtualized view: only rows render_start..render_stop of the
+        # current result are in the text widgets, top_row is shown first.
+        # A three-way result (base file set) also fills the middle pane.
+        self.result: Optional[Union[DiffResult, Merge3Result]] = None
+        self.top_row = 0
+        self.render_start = 0
+        self.render_stop = 0
+        
+        # Background comparison: the worker thread posts progress and the
+        # result to this queue, poll_worker() reads it on the Tk thread
+        self.worker: Optional[threading.Thread] = None
+        self.worker_queue: "queue.Queue[tuple]" = queue.Queue()
+        self.cancel_requested = False
+        
+        # Watch mode: the compared pair, re-diffed in place when a file
+        # changes, and the pending check for changes
+        self.watched: Optional[WatchedPair] = None
+        self.watch_after: Optional[str] = None
+        
         # Configure colors
         self.colors = {
             DiffType.EQUAL: {"bg": "#f8f9fa", "fg": "#6c757d"},
             DiffType.DELETE: {"bg": "#f8d7da", "fg": "#721c24"},
             DiffType.INSERT: {"bg": "#d4edda", "fg": "#155724"},
-            DiffType.REPLACE: {"bg": "#fff3cd", "fg": "#856404"}
+            DiffType.REPLACE: {"bg": "#fff3cd", "fg": "#856404"},
+            DiffType.CONFLICT: {"bg": "#f5c2c7", "fg": "#58151c"},
+            DiffType.MOVE: {"bg": "#e2d9f3", "fg": "#432874"}
         }
+        # Changed spans inside replaced lines, per side
+        self.span_colors = {"left": "#f1aeb5", "base": "#f1aeb5", "right": "#a3cfbb"}
         
         # Setup GUI
         self.setup_gui()
@@ -59,6 +95,13 @@ class DiffGUI:
         self.file2_entry.grid(row=1, column=1, sticky=(tk.W, tk.E), padx=(0, 5), pady=(5, 0))
         ttk.Button(file_frame, text="Browse", command=self.browse_file2).grid(row=1, column=2, pady=(5, 0))
         
+        # Optional base file for a three-way comparison
+        ttk.Label(file_frame, text="Base (optional):").grid(row=2, column=0, sticky=tk.W, padx=(0, 5), pady=(5, 0))
+        self.base_var = tk.StringVar()
+        self.base_entry = ttk.Entry(file_frame, textvariable=self.base_var, width=50)
+        self.base_entry.grid(row=2, column=1, sticky=(tk.W, tk.E), padx=(0, 5), pady=(5, 0))
+        ttk.Button(file_frame, text="Browse", command=self.browse_base).grid(row=2, column=2, pady=(5, 0))
+        
         # Options frame
         options_frame = ttk.LabelFrame(main_frame, text="Options", padding="10")
         options_frame.grid(row=1, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=(0, 10))
@@ -67,33 +110,75 @@ class DiffGUI:
         ttk.Checkbutton(options_frame, text="Ignore whitespace", 
                        variable=self.ignore_whitespace_var).grid(row=0, column=0, sticky=tk.W)
         
-        ttk.Button(options_frame, text="Compare Files", 
-                  command=self.compare_files).grid(row=0, column=1, padx=(20, 0))
+        self.ignore_case_var = tk.BooleanVar()
+        ttk.Checkbutton(options_frame, text="Ignore case", 
+                       variable=self.ignore_case_var).grid(row=0, column=1, sticky=tk.W, padx=(10, 0))
+        
+        self.ignore_blank_lines_var = tk.BooleanVar()
+        ttk.Checkbutton(options_frame, text="Ignore blank lines", 
+                       variable=self.ignore_blank_lines_var).grid(row=0, column=2, sticky=tk.W, padx=(10, 0))
+        
+        self.compare_button = ttk.Button(options_frame, text="Compare Files", 
+                                        command=self.compare_files)
+        self.watch_var = tk.BooleanVar()
+        ttk.Checkbutton(options_frame, text="Watch files", 
+                       variable=self.watch_var).grid(row=0, column=3, sticky=tk.W, padx=(10, 0))
+        
+        self.compare_button.grid(row=0, column=4, padx=(20, 0))
+        
+        self.cancel_button = ttk.Button(options_frame, text="Cancel", 
+                                       command=self.cancel_compare, state=tk.DISABLED)
+        self.cancel_button.grid(row=0, column=5, padx=(5, 0))
         
         # Main comparison frame
         comparison_frame = ttk.Frame(main_frame)
         comparison_frame.grid(row=2, column=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S))
         comparison_frame.columnconfigure(0, weight=1)
-        comparison_frame.columnconfigure(1, weight=1)
+        comparison_frame.columnconfigure(2, weight=1)
         comparison_frame.rowconfigure(1, weight=1)
+        self.comparison_frame = comparison_frame
         
         # File labels
         self.file1_label = ttk.Label(comparison_frame, text="File 1", font=("Arial", 10, "bold"))
         self.file1_label.grid(row=0, column=0, sticky=tk.W, padx=(0, 5))
         
+        self.base_label = ttk.Label(comparison_frame, text="Base", font=("Arial", 10, "bold"))
+        self.base_label.grid(row=0, column=1, sticky=tk.W, padx=5)
+        
         self.file2_label = ttk.Label(comparison_frame, text="File 2", font=("Arial", 10, "bold"))
-        self.file2_label.grid(row=0, column=1, sticky=tk.W, padx=(5, 0))
+        self.file2_label.grid(row=0, column=2, sticky=tk.W, padx=(5, 0))
         
-        # Text widgets with scrollbars
-        self.text1 = scrolledtext.ScrolledText(comparison_frame, wrap=tk.NONE, width=50, height=30)
+        # Text widgets sharing one scrollbar; they only hold the rendered rows.
+        # The base pane in the middle is only shown for three-way results.
+        self.text1 = tk.Text(comparison_frame, wrap=tk.NONE, width=50, height=30)
         self.text1.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), padx=(0, 5))
         
-        self.text2 = scrolledtext.ScrolledText(comparison_frame, wrap=tk.NONE, width=50, height=30)
-        self.text2.grid(row=1, column=1, sticky=(tk.W, tk.E, tk.N, tk.S), padx=(5, 0))
+        self.text_base = tk.Text(comparison_frame, wrap=tk.NONE, width=50, height=30)
+        self.text_base.grid(row=1, column=1, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5)
+        
+        self.text2 = tk.Text(comparison_frame, wrap=tk.NONE, width=50, height=30)
+        self.text2.grid(row=1, column=2, sticky=(tk.W, tk.E, tk.N, tk.S), padx=(5, 0))
         
-        # Synchronize scrolling
-        self.text1.config(yscrollcommand=self.sync_scroll)
-        self.text2.config(yscrollcommand=self.sync_scroll)
+        self.scrollbar = ttk.Scrollbar(comparison_frame, orient=tk.VERTICAL, command=self.sync_scroll)
+        self.scrollbar.grid(row=1, column=3, sticky=(tk.N, tk.S))
+        self.text_font = tkfont.Font(font=self.text1.cget("font"))
+        
+        # Panes filled from each result row, in row order
+        self.panes = [self.text1, self.text2]
+        self.show_base_pane(False)
+        
+        # Synchronize scrolling: every scroll goes through scroll_to
+        for text_widget in [self.text1, self.text_base, self.text2]:
+            text_widget.bind("<MouseWheel>", self.on_mousewheel)
+            text_widget.bind("<Button-4>", self.on_mousewheel)
+            text_widget.bind("<Button-5>", self.on_mousewheel)
+            text_widget.bind("<Up>", lambda e: self.scroll_by(-1))
+            text_widget.bind("<Down>", lambda e: self.scroll_by(1))
+            text_widget.bind("<Prior>", lambda e: self.scroll_by(-self.visible_rows()))
+            text_widget.bind("<Next>", lambda e: self.scroll_by(self.visible_rows()))
+            text_widget.bind("<Control-Home>", lambda e: self.scroll_by(-len(self.result or ())))
+            text_widget.bind("<Control-End>", lambda e: self.scroll_by(len(self.result or ())))
+        self.text1.bind("<Configure>", lambda e: self.scroll_to(self.top_row))
         
         # Status bar
         self.status_var = tk.StringVar()
@@ -106,17 +191,85 @@ class DiffGUI:
     
     def configure_text_tags(self):
         """Configure text widget tags for different diff types"""
-        for text_widget in [self.text1, self.text2]:
+        for text_widget, side in [(self.text1, "left"), (self.text_base, "base"), (self.text2, "right")]:
             for diff_type, colors in self.colors.items():
                 text_widget.tag_config(diff_type.value, 
                                      background=colors["bg"], 
                                      foreground=colors["fg"])
+            # Created last so it takes priority over the line colors
+            text_widget.tag_config("changed", background=self.span_colors[side])
+    
+    def show_base_pane(self, show: bool):
+        """Switch between the two-pane and the three-pane (ours, base, theirs) layout"""
+        if show:
+            self.base_label.grid()
+            self.text_base.grid()
+            self.panes = [self.text1, self.text_base, self.text2]
+        else:
+            self.base_label.grid_remove()
+            self.text_base.grid_remove()
+            self.panes = [self.text1, self.text2]
+        self.comparison_frame.columnconfigure(1, weight=1 if show else 0)
     
     def sync_scroll(self, *args):
-        """Synchronize scrolling between text widgets"""
+        """Scrollbar command: move both panes to the same row"""
+        if self.result is None:
+            return
         if args[0] == 'moveto':
-            self.text1.yview_moveto(args[1])
-            self.text2.yview_moveto(args[1])
+            self.scroll_to(int(float(args[1]) * len(self.result)))
+        elif args[0] == 'scroll':
+            amount = int(args[1])
+            if args[2] == 'pages':
+                amount *= self.visible_rows()
+            self.scroll_by(amount)
+    
+    def on_mousewheel(self, event):
+        """Scroll both panes three rows per wheel notch"""
+        if event.num == 4 or event.delta > 0:
+            return self.scroll_by(-3)
+        return self.scroll_by(3)
+    
+    def scroll_by(self, rows: int):
+        """Scroll both panes by a number of rows"""
+        self.scroll_to(self.top_row + rows)
+        return "break"
+    
+    def visible_rows(self) -> int:
+        """Number of rows that fit in a text widget"""
+        height = self.text1.winfo_height()
+        if height <= 1:
+            # Not mapped yet
+            return int(self.text1.cget("height"))
+        return max(1, height // self.text_font.metrics("linespace"))
+    
+    def scroll_to(self, row: int):
+        """Show rows starting at row, re-rendering only outside the buffered range"""
+        total = len(self.result) if self.result is not None else 0
+        visible = self.visible_rows()
+        row = max(0, min(row, total - visible))
+        self.top_row = row
+        
+        if not (self.render_start <= row and min(row + visible, total) <= self.render_stop):
+            self.render_rows(max(0, row - RENDER_BUFFER), min(total, row + visible + RENDER_BUFFER))
+        
+        for text_widget in self.panes:
+            text_widget.yview(f"{row - self.render_start + 1}.0")
+        if total:
+            self.scrollbar.set(row / total, min(1.0, (row + visible) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+    
+    def render_rows(self, start: int, stop: int):
+        """Replace the text widget contents with rows start..stop of the result"""
+        for text_widget in self.panes:
+            text_widget.delete(1.0, tk.END)
+        self.render_start = start
+        self.render_stop = stop
+        if self.result is None:
+            return
+        for row, lines in enumerate(self.result.iter_rows(start, stop), start=1):
+            for text_widget, line in zip(self.panes, lines):
+                self.insert_line(text_widget, row, line)
     
     def browse_file1(self):
         """Browse for first file"""
@@ -138,10 +291,20 @@ class DiffGUI:
             self.file2_var.set(filename)
             self.file2_path = filename
     
+    def browse_base(self):
+        """Browse for the common base of a three-way comparison"""
+        filename = filedialog.askopenfilename(
+            title="Select base file",
+            filetypes=[("Text files", "*.txt"), ("All files", "*.*")]
+        )
+        if filename:
+            self.base_var.set(filename)
+    
     def compare_files(self):
-        """Compare the selected files"""
+        """Compare the selected files (three-way when a base file is set)"""
         file1 = self.file1_var.get().strip()
         file2 = self.file2_var.get().strip()
+        base = self.base_var.get().strip() or None
         
         if not file1 or not file2:
             messagebox.showerror("Error", "Please select both files")
@@ -155,61 +318,179 @@ class DiffGUI:
             messagebox.showerror("Error", f"File not found: {file2}")
             return
         
+        if base is not None and not os.path.exists(base):
+            messagebox.showerror("Error", f"File not found: {base}")
+            return
+        
+        if self.worker is not None:
+            return
+        
+        # Configure engine
+        self.engine.ignore_whitespace = self.ignore_whitespace_var.get()
+        self.engine.ignore_case = self.ignore_case_var.get()
+        self.engine.ignore_blank_lines = self.ignore_blank_lines_var.get()
+        self.engine.progress = self.on_progress
+        
+        # Three-way comparisons are not watched
+        if self.watch_after is not None:
+            self.root.after_cancel(self.watch_after)
+            self.watch_after = None
+        self.watched = WatchedPair(self.engine, file1, file2) if self.watch_var.get() and base is None else None
+        
+        self.status_var.set("Comparing files...")
+        self.start_worker(file1, file2, base)
+    
+    def start_worker(self, file1: str, file2: str, base: Optional[str] = None, update: bool = False):
+        """Run the comparison off the Tk thread"""
+        self.engine.timer = PhaseTimer()
+        self.cancel_requested = False
+        self.compare_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.worker = threading.Thread(target=self.compare_worker, args=(file1, file2, base, update),
+                                       daemon=True)
+        self.worker.start()
+        self.root.after(POLL_INTERVAL_MS, self.poll_worker)
+    
+    def check_watched(self):
+        """Watch mode: re-diff the watched pair if either file changed since the last check"""
+        self.watch_after = None
+        if self.watched is None or not self.watch_var.get():
+            self.watched = None
+            return
+        if self.worker is None and self.watched.changed():
+            self.status_var.set("Files changed, updating...")
+            file1, file2 = (watched.path for watched in self.watched.files)
+            self.start_worker(file1, file2, update=True)
+            return
+        self.watch_after = self.root.after(int(POLL_INTERVAL * 1000), self.check_watched)
+    
+    def cancel_compare(self):
+        """Stop the running comparison"""
+        if self.worker is not None:
+            self.cancel_requested = True
+            self.engine.cancel()
+            self.status_var.set("Cancelling...")
+    
+    def on_progress(self, phase: str, done: int, total: int):
+        """Engine progress callback; runs on the worker thread"""
+        self.worker_queue.put(("progress", phase, done, total))
+    
+    def compare_worker(self, file1: str, file2: str, base: Optional[str] = None, update: bool = False):
+        """Worker thread: run the engine and post the outcome"""
         try:
-            # Update status
-            self.status_var.set("Comparing files...")
-            self.root.update()
-            
-            # Configure engine
-            self.engine.ignore_whitespace = self.ignore_whitespace_var.get()
-            
-            # Compare files
-            left_diff, right_diff = self.engine.compare_files(file1, file2)
+            if base is not None:
+                result = self.engine.compare3(base, file1, file2)
+            elif self.watched is not None:
+                # Only the changed lines are re-diffed after the first time
+                result = self.watched.refresh() or self.watched.result
+            else:
+                result = self.engine.diff_files(file1, file2)
+            self.worker_queue.put(("done", result, file1, file2, base, update))
+        except DiffCancelled:
+            self.worker_queue.put(("cancelled",))
+        except Exception as e:
+            self.worker_queue.put(("error", e))
+    
+    def poll_worker(self):
+        """Apply queued worker messages on the Tk thread"""
+        finished = None
+        progress = None
+        while True:
+            try:
+                message = self.worker_queue.get_nowait()
+            except queue.Empty:
+                break
+            if message[0] == "progress":
+                progress = message
+            else:
+                finished = message
+        
+        if finished is None:
+            if progress is not None and not self.cancel_requested:
+                self.status_var.set(self.format_progress(*progress[1:]))
+            self.root.after(POLL_INTERVAL_MS, self.poll_worker)
+            return
+        
+        self.worker = None
+        self.compare_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
+        
+        if finished[0] == "cancelled" or self.cancel_requested:
+            # A cancelled re-diff leaves the watched pair half updated
+            self.watched = None
+            self.status_var.set("Comparison cancelled")
+        elif finished[0] == "error":
+            self.watched = None
+            messagebox.showerror("Error", f"Failed to compare files: {str(finished[1])}")
+            self.status_var.set("Error occurred")
+        else:
+            _, result, file1, file2, base, update = finished
+            self.status_var.set(f"Rendering {len(result)} rows...")
             
             # Display results
-            self.display_diff(left_diff, right_diff, file1, file2)
+            timer = self.engine.timer
+            with timer.phase("render"):
+                self.display_diff(result, file1, file2, base, keep_position=update)
+                self.root.update_idletasks()
             
-            # Update status with statistics
-            stats = self.engine.get_stats(left_diff, right_diff)
-            status_text = f"Added: {stats['added_lines']}, Deleted: {stats['deleted_lines']}, Changed: {stats['changed_lines']}, Unchanged: {stats['unchanged_lines']}"
-            self.status_var.set(status_text)
-            
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to compare files: {str(e)}")
-            self.status_var.set("Error occurred")
+            # Update status with statistics and where the time went
+            if base is not None:
+                stats = result.stats()
+                status_text = f"Conflicts: {stats['conflicts']}, Changed in File 1: {stats['ours_lines']}, Changed in File 2: {stats['theirs_lines']}, Changed in both: {stats['both_lines']}"
+            else:
+                stats = self.engine.get_stats(result)
+                status_text = f"Added: {stats['added_lines']}, Deleted: {stats['deleted_lines']}, Changed: {stats['changed_lines']}, Moved: {stats['moved_lines']}, Unchanged: {stats['unchanged_lines']}"
+            if stats['approximate']:
+                status_text += " (approximate)"
+            self.status_var.set(f"{status_text}  |  {timer.summary()}")
+            if self.watched is not None:
+                self.watch_after = self.root.after(int(POLL_INTERVAL * 1000), self.check_watched)
     
-    def display_diff(self, left_diff: List[DiffLine], right_diff: List[DiffLine], 
-                    file1: str, file2: str):
-        """Display the diff results in the text widgets"""
-        # Clear existing content
-        self.text1.delete(1.0, tk.END)
-        self.text2.delete(1.0, tk.END)
-        
+    def format_progress(self, phase: str, done: int, total: int) -> str:
+        """Status bar text for an engine progress report"""
+        percent = 100 * done // total if total else 100
+        if phase == "read":
+            return f"Reading files... {done / 1048576:.1f} of {total / 1048576:.1f} MB ({percent}%)"
+        return f"Comparing lines... {percent}%"
+    
+    def display_diff(self, result: Union[DiffResult, Merge3Result], file1: str, file2: str,
+                     base: Optional[str] = None, keep_position: bool = False):
+        """Display the diff results in the text widgets.
+
+        With keep_position (a watch mode update) the view stays where it
+        was, or keeps following the end if it was showing the last row.
+        """
         # Update file labels
         self.file1_label.config(text=f"File 1: {os.path.basename(file1)}")
         self.file2_label.config(text=f"File 2: {os.path.basename(file2)}")
+        if base is not None:
+            self.base_label.config(text=f"Base: {os.path.basename(base)}")
         
-        # Display diff lines
-        for left_line, right_line in zip(left_diff, right_diff):
-            # Format left line
-            left_text = self.format_line(left_line)
-            left_start = self.text1.index(tk.INSERT)
-            self.text1.insert(tk.END, left_text + "\n")
-            left_end = self.text1.index(tk.INSERT + "-1c")
-            self.text1.tag_add(left_line.diff_type.value, left_start, left_end)
-            
-            # Format right line
-            right_text = self.format_line(right_line)
-            right_start = self.text2.index(tk.INSERT)
-            self.text2.insert(tk.END, right_text + "\n")
-            right_end = self.text2.index(tk.INSERT + "-1c")
-            self.text2.tag_add(right_line.diff_type.value, right_start, right_end)
-        
-        # Scroll to top
-        self.text1.see(1.0)
-        self.text2.see(1.0)
-    
-    def format_line(self, line: DiffLine) -> str:
+        top_row = 0
+        if keep_position and self.result is not None:
+            at_end = self.top_row + self.visible_rows() >= len(self.result)
+            top_row = len(result) if at_end else self.top_row
+        
+        # Render the first screen; the rest is rendered on scroll
+        for text_widget in self.panes:
+            text_widget.delete(1.0, tk.END)
+        self.show_base_pane(base is not None)
+        self.result = result
+        self.render_start = self.render_stop = 0
+        self.render_rows(0, 0)
+        self.scroll_to(top_row)
+    
+    def insert_line(self, text_widget, row: int, line: DiffLine):
+        """Append one formatted line and tag it, including any changed spans"""
+        text = self.format_line(line, "left" if text_widget is self.text1 else "right")
+        text_widget.insert(tk.END, text + "\n")
+        text_widget.tag_add(line.diff_type.value, f"{row}.0", f"{row}.end")
+        if line.spans:
+            offset = len(text) - len(line.content)
+            for start, end in line.spans:
+                text_widget.tag_add("changed", f"{row}.{offset + start}", f"{row}.{offset + end}")
+    
+    def format_line(self, line: DiffLine, side: str = "left") -> str:
         """Format a diff line for display"""
         line_num = f"{line.line_num:4d}" if line.line_num else "    "
         
@@ -219,6 +500,16 @@ class DiffGUI:
             return f"{line_num} + {line.content}"
         elif line.diff_type == DiffType.REPLACE and line.line_num is not None:
             return f"{line_num} ~ {line.content}"
+        elif line.diff_type == DiffType.CONFLICT and line.line_num is not None:
+            return f"{line_num} ! {line.content}"
+        elif line.diff_type == DiffType.MOVE:
+            # Where the block went or came from, on its first line
+            i1, i2, j1, j2 = line.move
+            if side == "left":
+                note = f"  (moved to {j1 + 1}-{j2})" if line.line_num == i1 + 1 else ""
+            else:
+                note = f"  (moved from {i1 + 1}-{i2})" if line.line_num == j1 + 1 else ""
+            return f"{line_num} M {line.content}{note}"
         else:
             return f"{line_num}   {line.content}"
 
@@ -5,11 +5,13 @@ Provides both CLI and GUI interfaces for file comparison
 """
 
 import sys
+import os
 import argparse
-from pathlib import Path
 
 # Add src directory to path so we can import modules
-sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from options import add_compare_arguments, add_file_arguments
 
 def main():
     parser = argparse.ArgumentParser(
@@ -21,22 +23,18 @@ Examples:
   python main.py --gui                         # Launch GUI
   python main.py -w file1.txt file2.txt       # Ignore whitespace
   python main.py -s file1.txt file2.txt       # Show statistics
+  python main.py -q file1.txt file2.txt       # Exit code only (for scripts and CI)
+  python main.py -u old.txt new.txt > fix.patch  # Unified diff for patch
+  python main.py --format ndjson a.txt b.txt  # One JSON record per hunk
+  python main.py -a myers file1.txt file2.txt # Use the Myers algorithm
+  python main.py -r -j 8 dir1 dir2             # Compare directory trees
+  python main.py --against-many ref.txt out*.txt  # One reference, many files
         """
     )
     
-    parser.add_argument("file1", nargs="?", help="First file to compare")
-    parser.add_argument("file2", nargs="?", help="Second file to compare")
+    add_file_arguments(parser, optional=True, many=True)
     parser.add_argument("--gui", action="store_true", help="Launch GUI interface")
-    parser.add_argument("-w", "--ignore-whitespace", action="store_true", 
-                       help="Ignore whitespace differences")
-    parser.add_argument("-c", "--context", type=int, default=3,
-                       help="Number of context lines to show")
-    parser.add_argument("--no-color", action="store_true",
-                       help="Disable colored output")
-    parser.add_argument("--width", type=int, default=120,
-                       help="Output width (default: 120)")
-    parser.add_argument("-s", "--stats", action="store_true",
-                       help="Show statistics")
+    add_compare_arguments(parser)
     
     args = parser.parse_args()
     
@@ -55,34 +53,13 @@ Examples:
             parser.error("Both file1 and file2 are required for CLI mode")
         
         try:
-            from cli import main as cli_main
-            # Set up sys.argv for CLI module
-            cli_args = [sys.argv[0]]  # Script name
-            cli_args.extend([args.file1, args.file2])
-            
-            if args.ignore_whitespace:
-                cli_args.append("--ignore-whitespace")
-            if args.context != 3:
-                cli_args.extend(["--context", str(args.context)])
-            if args.no_color:
-                cli_args.append("--no-color")
-            if args.width != 120:
-                cli_args.extend(["--width", str(args.width)])
-            if args.stats:
-                cli_args.append("--stats")
-            
-            # Replace sys.argv temporarily
-            original_argv = sys.argv
-            sys.argv = cli_args
-            
-            try:
-                cli_main()
-            finally:
-                sys.argv = original_argv
-                
+            from cli import run
         except ImportError as e:
             print(f"Error: CLI dependencies not available: {e}", file=sys.stderr)
             sys.exit(1)
+        
+        # Same argument model as cli.py, so the parsed arguments go straight through
+        sys.exit(run(args))
 
 if __name__ == "__main__":
     main()
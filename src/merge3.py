@@ -0,0 +1,184 @@
+import bisect
+from array import array
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from diff_engine import DiffLine, DiffType, Opcode
+
+# Region kinds: which side changed the base range
+UNCHANGED = "unchanged"
+OURS = "ours"
+THEIRS = "theirs"
+BOTH = "both"  # the same change on both sides
+CONFLICT = "conflict"
+
+# (kind, base_lo, base_hi, ours_lo, ours_hi, theirs_lo, theirs_hi)
+Region = Tuple[str, int, int, int, int, int, int]
+
+# Row type of each pane (ours, base, theirs) per region kind
+_ROW_TYPES = {
+    UNCHANGED: (DiffType.EQUAL, DiffType.EQUAL, DiffType.EQUAL),
+    OURS: (DiffType.REPLACE, DiffType.EQUAL, DiffType.EQUAL),
+    THEIRS: (DiffType.EQUAL, DiffType.EQUAL, DiffType.REPLACE),
+    BOTH: (DiffType.REPLACE, DiffType.EQUAL, DiffType.REPLACE),
+    CONFLICT: (DiffType.CONFLICT, DiffType.CONFLICT, DiffType.CONFLICT),
+}
+
+
+def _equal_blocks(opcodes: List[Opcode]) -> List[Tuple[int, int, int]]:
+    """(base start, other start, size) of each 'equal' opcode"""
+    return [(i1, j1, i2 - i1) for tag, i1, i2, j1, j2 in opcodes if tag == 'equal']
+
+
+def _sync_regions(ours_opcodes: List[Opcode], theirs_opcodes: List[Opcode],
+                  n: int, ours_len: int, theirs_len: int) -> List[Tuple[int, int, int, int]]:
+    """Base ranges unchanged on both sides as (base, ours, theirs, size), plus an end sentinel.
+
+    Both block lists are sorted by base position, so one merge-style pass
+    over them finds every overlap.
+    """
+    ours_blocks = _equal_blocks(ours_opcodes)
+    theirs_blocks = _equal_blocks(theirs_opcodes)
+    regions = []
+    k = l = 0
+    while k < len(ours_blocks) and l < len(theirs_blocks):
+        base1, ours, size1 = ours_blocks[k]
+        base2, theirs, size2 = theirs_blocks[l]
+        start = max(base1, base2)
+        end = min(base1 + size1, base2 + size2)
+        if start < end:
+            regions.append((start, ours + start - base1, theirs + start - base2, end - start))
+        if base1 + size1 < base2 + size2:
+            k += 1
+        else:
+            l += 1
+    regions.append((n, ours_len, theirs_len, 0))
+    return regions
+
+
+def merge_regions(base_keys: Sequence, ours_keys: Sequence, theirs_keys: Sequence,
+                  ours_opcodes: List[Opcode], theirs_opcodes: List[Opcode]) -> List[Region]:
+    """Classify the base into unchanged, one-sided, identical and conflicting regions.
+
+    ours_opcodes and theirs_opcodes diff base against each side. Each line
+    is looked at a constant number of times, so this is linear in the total
+    size of the three inputs.
+    """
+    regions = []
+    base_pos = ours_pos = theirs_pos = 0
+    for base, ours, theirs, size in _sync_regions(ours_opcodes, theirs_opcodes, len(base_keys),
+                                                   len(ours_keys), len(theirs_keys)):
+        if base_pos < base or ours_pos < ours or theirs_pos < theirs:
+            base_chunk = base_keys[base_pos:base]
+            ours_chunk = ours_keys[ours_pos:ours]
+            theirs_chunk = theirs_keys[theirs_pos:theirs]
+            if ours_chunk == theirs_chunk:
+                kind = BOTH
+            elif ours_chunk == base_chunk:
+                kind = THEIRS
+            elif theirs_chunk == base_chunk:
+                kind = OURS
+            else:
+                kind = CONFLICT
+            regions.append((kind, base_pos, base, ours_pos, ours, theirs_pos, theirs))
+        if size:
+            regions.append((UNCHANGED, base, base + size, ours, ours + size, theirs, theirs + size))
+        base_pos, ours_pos, theirs_pos = base + size, ours + size, theirs + size
+    return regions
+
+
+class Merge3Result:
+    """Three-way comparison of base, ours and theirs as a list of regions.
+
+    Like DiffResult, rows for the three-pane view are only built while
+    iterating. Merged text takes each side's lines as they are, so raw
+    lines (see DiffEngine.diff_files) are written back byte for byte.
+    """
+
+    def __init__(self, base: Sequence[str], ours: Sequence[str], theirs: Sequence[str],
+                 regions: List[Region], raw: bool = False, approximate: bool = False):
+        self.base = base
+        self.ours = ours
+        self.theirs = theirs
+        self.regions = regions
+        # Lines carry their endings, so conflict markers need one too
+        self.raw = raw
+        # True when the cost budget ran out for either side
+        self.approximate = approximate
+        # Row index where each region starts, plus the total at the end
+        starts = array('q', [0])
+        for _, b1, b2, o1, o2, t1, t2 in regions:
+            starts.append(starts[-1] + max(b2 - b1, o2 - o1, t2 - t1))
+        self._row_starts = starts
+
+    @property
+    def conflicts(self) -> int:
+        return sum(1 for region in self.regions if region[0] == CONFLICT)
+
+    def __len__(self) -> int:
+        return self._row_starts[-1]
+
+    def iter_rows(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[DiffLine, DiffLine, DiffLine]]:
+        """Yield aligned (ours, base, theirs) rows in the range start..stop"""
+        starts = self._row_starts
+        stop = len(self) if stop is None else min(stop, len(self))
+        if start >= stop:
+            return
+        idx = bisect.bisect_right(starts, start) - 1
+        while start < stop:
+            region_start = starts[idx]
+            region_stop = min(stop, starts[idx + 1])
+            kind, b1, b2, o1, o2, t1, t2 = self.regions[idx]
+            panes = tuple(zip((self.ours, self.base, self.theirs), (o1, b1, t1), (o2, b2, t2),
+                              _ROW_TYPES[kind]))
+            for k in range(start - region_start, region_stop - region_start):
+                yield tuple(DiffLine(lo + k + 1, lines[lo + k], diff_type) if lo + k < hi
+                            else DiffLine(None, "", diff_type)
+                            for lines, lo, hi, diff_type in panes)
+            start = region_stop
+            idx += 1
+
+    def merged_lines(self, ours_label: str = "ours", theirs_label: str = "theirs",
+                     base_label: Optional[str] = None) -> Iterator[str]:
+        """Merged text line by line, with conflict markers around each conflict.
+
+        With base_label the base version is included in each conflict
+        (diff3 style). Lines keep their own endings.
+        """
+        end = "\n" if self.raw else ""
+        for kind, b1, b2, o1, o2, t1, t2 in self.regions:
+            if kind in (UNCHANGED, OURS, BOTH):
+                yield from self.ours[o1:o2]
+            elif kind == THEIRS:
+                yield from self.theirs[t1:t2]
+            else:
+                yield f"<<<<<<< {ours_label}{end}"
+                yield from self._terminated(self.ours[o1:o2])
+                if base_label is not None:
+                    yield f"||||||| {base_label}{end}"
+                    yield from self._terminated(self.base[b1:b2])
+                yield f"======={end}"
+                yield from self._terminated(self.theirs[t1:t2])
+                yield f">>>>>>> {theirs_label}{end}"
+
+    def stats(self) -> dict:
+        """Line counts per region kind and the number of conflicts"""
+        lines = {kind: 0 for kind in _ROW_TYPES}
+        for kind, b1, b2, o1, o2, t1, t2 in self.regions:
+            lines[kind] += max(b2 - b1, o2 - o1, t2 - t1)
+        return {
+            'unchanged_lines': lines[UNCHANGED],
+            'ours_lines': lines[OURS],
+            'theirs_lines': lines[THEIRS],
+            'both_lines': lines[BOTH],
+            'conflict_lines': lines[CONFLICT],
+            'conflicts': self.conflicts,
+            'approximate': self.approximate,
+        }
+
+    def _terminated(self, lines: Sequence[str]) -> Iterator[str]:
+        """Lines of a conflict side; a raw last line gets an ending so the next marker starts a line"""
+        if not self.raw:
+            yield from lines
+            return
+        for line in lines:
+            yield line if line.endswith('\n') else line + '\n'
@@ -0,0 +1,132 @@
+import re
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+# Masks selectable by name with --mask; anything else is used as a regex
+BUILTIN_MASKS = {
+    'timestamp': r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?',
+    'time': r'\b\d{1,2}:\d{2}:\d{2}(?:[.,]\d+)?\b',
+    'guid': r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b',
+    'hex': r'\b0[xX][0-9a-fA-F]+\b',
+    'ipv4': r'\b\d{1,3}(?:\.\d{1,3}){3}\b',
+    'number': r'\d+',
+}
+
+# Replacement for masked text. NUL can occur in decoded content, so keys of
+# lines that hold one have every literal NUL doubled: a NUL in a key is then
+# followed by \x01 only where it came from a mask
+MASK_PLACEHOLDER = '\x00\x01'
+
+
+def _strip_trailing_cr(line: str) -> str:
+    if line.endswith('\r\n'):
+        # Raw lines keep their ending
+        return line[:-2] + '\n'
+    if line.endswith('\r'):
+        return line[:-1]
+    return line
+
+
+def _collapse_whitespace(line: str) -> str:
+    # Same result as re.sub(r'\s+', ' ', line).strip(), without the regex
+    return ' '.join(line.split())
+
+
+class Normalizer:
+    """Maps lines to the keys they are compared by.
+
+    The enabled steps are composed once: trailing CR removal, regex masks
+    (all masks run as one alternation), case folding and whitespace
+    collapsing, in that order. apply() runs the builtin masks and case
+    folding over the whole text at once where that cannot change the line
+    count, and the other steps as C-level str methods via map(). Regex
+    masks always run per line, so their anchors, lookarounds and line
+    breaks never see a neighbouring line.
+    """
+
+    def __init__(self, ignore_whitespace: bool = False, ignore_case: bool = False,
+                 ignore_blank_lines: bool = False, ignore_trailing_cr: bool = False,
+                 masks: Sequence[str] = ()):
+        self.ignore_whitespace = ignore_whitespace
+        self.ignore_case = ignore_case
+        self.ignore_blank_lines = ignore_blank_lines
+        self.ignore_trailing_cr = ignore_trailing_cr
+        self.masks = tuple(masks)
+        self._mask_re = None
+        if self.masks:
+            patterns = [BUILTIN_MASKS.get(mask, mask) for mask in self.masks]
+            self._mask_re = re.compile('|'.join(f'(?:{pattern})' for pattern in patterns))
+
+        # (step, whether it can run over the whole text at once)
+        steps: List[Tuple[Callable[[str], str], bool]] = []
+        if ignore_trailing_cr:
+            steps.append((_strip_trailing_cr, False))
+        if self._mask_re is not None:
+            # The builtin masks match the same over the joined text as per line
+            steps.append((self._mask, all(mask in BUILTIN_MASKS for mask in self.masks)))
+        if ignore_case:
+            steps.append((str.casefold, True))
+        if ignore_whitespace:
+            steps.append((_collapse_whitespace, False))
+        self._steps = steps
+
+    @property
+    def options(self) -> Tuple:
+        """Everything that changes the keys, e.g. for cache keys"""
+        return (self.ignore_whitespace, self.ignore_case, self.ignore_blank_lines,
+                self.ignore_trailing_cr, self.masks)
+
+    @property
+    def is_identity(self) -> bool:
+        """True when every line is its own key"""
+        return not self._steps
+
+    def _mask(self, text: str) -> str:
+        if '\x00' not in text:
+            return self._mask_re.sub(MASK_PLACEHOLDER, text)
+        # Double the literal NULs between the masked spans
+        pieces = []
+        pos = 0
+        for match in self._mask_re.finditer(text):
+            pieces.append(text[pos:match.start()].replace('\x00', '\x00\x00'))
+            pieces.append(MASK_PLACEHOLDER)
+            pos = match.end()
+        pieces.append(text[pos:].replace('\x00', '\x00\x00'))
+        return ''.join(pieces)
+
+    def __call__(self, line: str) -> str:
+        """Key of a single line"""
+        for step, _ in self._steps:
+            line = step(line)
+        return line
+
+    def apply(self, lines: List[str]) -> List[str]:
+        """Keys of a list of lines (the lines themselves when nothing is enabled)"""
+        if not self._steps:
+            return lines
+        keys = lines
+        for step, whole_text in self._steps:
+            if whole_text:
+                keys = self._apply_to_text(keys, step)
+            else:
+                keys = list(map(step, keys))
+        return keys
+
+    def _apply_to_text(self, lines: List[str], step: Callable[[str], str]) -> List[str]:
+        """Run step over all lines joined together, per line if that merges lines"""
+        if not lines or lines[0].endswith('\n'):
+            # Raw lines carry their own endings; not worth special-casing
+            return list(map(step, lines))
+        keys = step('\n'.join(lines)).split('\n')
+        if len(keys) != len(lines):
+            # A mask matched across a line break
+            return list(map(step, lines))
+        return keys
+
+    def is_blank(self, key: str) -> bool:
+        return not key or key.isspace()
+
+    def blank_flags(self, keys: Iterable[str]) -> Optional[List[bool]]:
+        """Which keys are blank lines to ignore (None when blank lines are compared)"""
+        if not self.ignore_blank_lines:
+            return None
+        return [self.is_blank(key) for key in keys]
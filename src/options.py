@@ -0,0 +1,153 @@
+"""Command-line options shared by the main, cdiff and gdiff entry points.
+
+Only imports the engine modules every command loads anyway, for the
+choices and defaults of its options; colorama, tkinter and the result
+cache are imported by the code that uses them.
+"""
+import argparse
+import os
+import re
+from typing import Optional
+
+from diff_engine import ALGORITHMS, DEFAULT_ALGORITHM, INTRALINE_MODES
+from normalizers import BUILTIN_MASKS
+from watch import POLL_INTERVAL
+
+# Values accepted by --format
+OUTPUT_FORMATS = ("side-by-side", "unified", "json", "ndjson")
+
+
+def mask_argument(value: str) -> str:
+    """--mask value: a builtin mask name or a valid regex"""
+    if value not in BUILTIN_MASKS:
+        try:
+            re.compile(value)
+        except re.error as e:
+            raise argparse.ArgumentTypeError(f"invalid mask regex {value!r}: {e}")
+    return value
+
+
+def add_file_arguments(parser: argparse.ArgumentParser, optional: bool = False, many: bool = False):
+    """The two file positionals (plus any further files with many) and --user-dir"""
+    nargs = "?" if optional else None
+    suffix = " (optional)" if optional else ""
+    parser.add_argument("file1", nargs=nargs, help=f"First file to compare{suffix}")
+    parser.add_argument("file2", nargs=nargs, help=f"Second file to compare{suffix}")
+    if many:
+        parser.add_argument("more_files", nargs="*", metavar="FILE",
+                            help="Further files to compare with file1 (with --against-many)")
+    parser.add_argument("--user-dir", help="Original user working directory for relative path resolution")
+
+
+def add_compare_arguments(parser: argparse.ArgumentParser):
+    """Every comparison and output option understood by cli.run()"""
+    parser.add_argument("-w", "--ignore-whitespace", action="store_true",
+                        help="Ignore whitespace differences")
+    parser.add_argument("-i", "--ignore-case", action="store_true",
+                        help="Ignore case differences")
+    parser.add_argument("-B", "--ignore-blank-lines", action="store_true",
+                        help="Ignore lines that are blank (or whitespace only)")
+    parser.add_argument("--strip-trailing-cr", action="store_true",
+                        help="Ignore a carriage return at the end of lines")
+    parser.add_argument("--mask", action="append", default=[], type=mask_argument, metavar="NAME_OR_REGEX",
+                        help="Compare text matching a regex, or a builtin mask "
+                             f"({', '.join(BUILTIN_MASKS)}), as equal; may be repeated")
+    parser.add_argument("-c", "--context", type=int, default=3,
+                        help="Number of context lines to show around changes (-1 shows all lines)")
+    parser.add_argument("--no-color", action="store_true",
+                        help="Disable colored output")
+    parser.add_argument("--width", type=int, default=120,
+                        help="Output width (default: 120)")
+    parser.add_argument("-s", "--stats", action="store_true",
+                        help="Show statistics")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="side-by-side",
+                        help="Output format (default: side-by-side); json/ndjson write one record per hunk "
+                             "and a final stats record")
+    parser.add_argument("-u", "--unified", dest="format", action="store_const", const="unified",
+                        help="Write a unified diff (patch format) using --context lines of context")
+    parser.add_argument("--no-contents", action="store_true",
+                        help="Leave line text out of json/ndjson records")
+    parser.add_argument("-q", "--brief", action="store_true",
+                        help="Only report whether the files differ")
+    parser.add_argument("--stats-only", action="store_true",
+                        help="Show statistics without the diff")
+    parser.add_argument("--no-moves", action="store_true",
+                        help="Do not detect moved blocks; show them as deleted and inserted lines")
+    parser.add_argument("-a", "--algorithm", choices=sorted(ALGORITHMS), default=DEFAULT_ALGORITHM,
+                        help=f"Diff algorithm (default: {DEFAULT_ALGORITHM})")
+    parser.add_argument("--intraline", choices=INTRALINE_MODES + ("none",), default="word",
+                        help="Highlight changed words or characters within changed lines (default: word)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream large files in bounded memory (resynchronizes on unique lines)")
+    parser.add_argument("--merge", metavar="BASE",
+                        help="Three-way merge: write file1 (ours) and file2 (theirs) merged against BASE, "
+                             "with conflict markers; exit code 1 if there are conflicts")
+    parser.add_argument("--against-many", action="store_true",
+                        help="Compare file1 with file2 and every further FILE, reading file1 only once; "
+                             "prints one line per file that differs")
+    parser.add_argument("--watch", type=float, nargs="?", const=POLL_INTERVAL, default=None, metavar="SECONDS",
+                        help="Keep running and show the diff again whenever either file changes, re-diffing "
+                             f"only the changed lines (checks every SECONDS, default: {POLL_INTERVAL})")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="Treat file1 and file2 as directories and compare them recursively")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="Worker processes: files compared at once with --recursive or --against-many "
+                             "(default: CPU count), "
+                             "or segments of one large pair diffed at once (default: 1)")
+    parser.add_argument("--max-cost", type=int, default=None, metavar="STEPS",
+                        help="Budget for the exact diff in algorithm steps; past it an approximate diff "
+                             "anchored on unique lines is used")
+    parser.add_argument("--timeout", type=float, default=None, metavar="SECONDS",
+                        help="Time budget for the exact diff; past it an approximate diff is used")
+    parser.add_argument("--progress", action="store_true",
+                        help="Report read/diff progress on stderr")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Directory for cached diff results (default: per-user cache directory)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Do not read or write cached diff results")
+    parser.add_argument("--timings", action="store_true",
+                        help="Print per-phase times, lines/s and peak memory (RSS) to stderr")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Like --timings, but measure peak memory with tracemalloc (Python allocations "
+                             "only; makes the run many times slower)")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="Write a cProfile dump of the comparison to FILE")
+
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    """--serve and --no-server, understood by cdiff (see diff_server.py)"""
+    parser.add_argument("--serve", action="store_true",
+                        help="Run a comparison server that later cdiff runs hand their arguments to, "
+                             "skipping start-up and keeping prepared files and caches warm")
+    parser.add_argument("--no-server", action="store_true",
+                        help="Compare in this process even when a comparison server is running")
+
+
+def engine_arguments(args: argparse.Namespace) -> dict:
+    """DiffEngine keyword arguments for parsed comparison options (see add_compare_arguments)"""
+    options = {
+        'ignore_whitespace': args.ignore_whitespace,
+        'ignore_case': args.ignore_case,
+        'ignore_blank_lines': args.ignore_blank_lines,
+        'ignore_trailing_cr': args.strip_trailing_cr,
+        'masks': args.mask,
+        'context_lines': args.context,
+        'algorithm': args.algorithm,
+        'intraline': None if args.intraline == "none" else args.intraline,
+        'max_cost': args.max_cost,
+        'timeout': args.timeout,
+        'detect_moves': not args.no_moves,
+    }
+    if not args.no_cache:
+        from diff_cache import DiffCache
+        options['cache'] = DiffCache(args.cache_dir)
+    return options
+
+
+def resolve_path(path: Optional[str], user_dir: Optional[str] = None) -> Optional[str]:
+    """Absolute path, with relative paths taken from user_dir (default: the current directory)"""
+    if not path:
+        return None
+    if not os.path.isabs(path):
+        path = os.path.join(user_dir or os.getcwd(), path)
+    return os.path.abspath(path)
@@ -0,0 +1,109 @@
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional
+
+
+class PhaseTimer:
+    """Accumulates wall time and item counts per named phase.
+
+    Phases may nest; time spent in an inner phase is not counted again in
+    the outer one, so the per-phase times add up to the total.
+    """
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+        self.items: Dict[str, int] = {}
+        # [name, start, seconds spent in nested phases] for each open phase
+        self._stack: List[list] = []
+
+    def _enter(self, name: str):
+        self._stack.append([name, time.perf_counter(), 0.0])
+
+    def _exit(self):
+        name, start, nested = self._stack.pop()
+        elapsed = time.perf_counter() - start
+        self.seconds[name] = self.seconds.get(name, 0.0) + elapsed - nested
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    @contextmanager
+    def phase(self, name: str, items: int = 0):
+        """Time the enclosed block as part of phase name"""
+        self._enter(name)
+        try:
+            yield
+        finally:
+            self._exit()
+            self.count(name, items)
+
+    def count(self, name: str, items: int):
+        """Add items (usually lines) processed by phase name"""
+        self.items[name] = self.items.get(name, 0) + items
+
+    def wrap(self, name: str, iterable: Iterable) -> Iterator:
+        """Yield from iterable, timing each step as phase name and counting items"""
+        iterator = iter(iterable)
+        while True:
+            self._enter(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self._exit()
+            self.items[name] = self.items.get(name, 0) + 1
+            yield item
+
+    def total(self) -> float:
+        return sum(self.seconds.values())
+
+    def summary(self) -> str:
+        """One-line breakdown, e.g. for a status bar"""
+        return ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.seconds.items())
+
+    def report(self, peak_memory: Optional[int] = None, memory_source: str = "RSS") -> List[str]:
+        """Human-readable breakdown, one line per phase in the order first seen"""
+        total = self.total()
+        lines = [f"{'phase':<12} {'seconds':>9} {'share':>6} {'lines/s':>12}"]
+        for name, seconds in self.seconds.items():
+            share = 100 * seconds / total if total else 0.0
+            items = self.items.get(name, 0)
+            rate = f"{items / seconds:,.0f}" if items and seconds > 0 else ""
+            lines.append(f"{name:<12} {seconds:>9.4f} {share:>5.1f}% {rate:>12}")
+        lines.append(f"{'total':<12} {total:>9.4f}")
+        if peak_memory is not None:
+            lines.append(f"peak memory: {peak_memory / (1024 * 1024):.1f} MB ({memory_source})")
+        return lines
+
+
+def peak_rss() -> Optional[int]:
+    """Peak resident set size of this process in bytes, or None if it cannot be read.
+
+    Read from the OS after the fact, so unlike tracemalloc it does not slow
+    down the phases being timed.
+    """
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage',
+                    'QuotaPagedPoolUsage', 'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage',
+                    'PagefileUsage', 'PeakPagefileUsage')]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.PeakWorkingSetSize
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
@@ -0,0 +1,139 @@
+import os
+import zlib
+from typing import List, Optional, Tuple
+
+from diff_engine import DiffEngine, DiffResult, decode_lines
+
+# Seconds between checks of the watched files' size and modification time
+POLL_INTERVAL = 0.5
+
+# Bytes read per step when checking that the start of a grown file is unchanged
+HEAD_CHUNK = 1 << 20
+
+
+class _WatchedFile:
+    """The lines of one watched file and what is needed to tell an append from a rewrite"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lines: List[str] = []
+        self.size: Optional[int] = None
+        self.mtime_ns: Optional[int] = None
+        self.encoding: Optional[str] = None
+        # Byte offset of the last line and its bytes: an append is read from
+        # there once those bytes, the CRC-32 of everything before them and
+        # the file's identity are found unchanged
+        self.tail_start = 0
+        self.tail = b''
+        self.head_crc = 0
+        self.identity: Optional[Tuple[int, int]] = None
+
+    def changed(self) -> bool:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            # Editors may save by replacing the file; wait until it is back
+            return False
+        return (st.st_size, st.st_mtime_ns) != (self.size, self.mtime_ns)
+
+    def read(self) -> Optional[Tuple[int, int, int]]:
+        """Bring lines up to date.
+
+        Returns the changed window (start, old_stop, new_stop) after an
+        append, or None after the whole file was re-read (lines is then a
+        new list and the old one is left as it was).
+        """
+        st = os.stat(self.path)
+        with open(self.path, 'rb') as f:
+            if self.size is not None and st.st_size > self.size and (st.st_dev, st.st_ino) == self.identity:
+                f.seek(self.tail_start)
+                data = f.read(st.st_size - self.tail_start)
+                # A rewrite that grew can still have the old last line at the same offset
+                appended = data.startswith(self.tail) and self._head_unchanged(f)
+                window = self._append(data) if appended else None
+                if window is not None:
+                    self._remember(st, self.tail_start, data)
+                    return window
+                f.seek(0)
+            data = f.read()
+        self.lines, self.encoding = decode_lines(data)
+        self._remember(st, 0, data)
+        return None
+
+    def _head_unchanged(self, f) -> bool:
+        """Whether the bytes before tail_start still have the remembered CRC-32"""
+        f.seek(0)
+        crc = 0
+        left = self.tail_start
+        while left:
+            chunk = f.read(min(left, HEAD_CHUNK))
+            if not chunk:
+                return False
+            crc = zlib.crc32(chunk, crc)
+            left -= len(chunk)
+        return crc == self.head_crc
+
+    def _append(self, data: bytes) -> Optional[Tuple[int, int, int]]:
+        """Replace the last line with the lines of data, read from tail_start"""
+        try:
+            new_lines, _ = decode_lines(data, self.encoding)
+        except UnicodeDecodeError:
+            # E.g. non-UTF-8 bytes appended to a UTF-8 file: re-read it all
+            return None
+        old_stop = len(self.lines)
+        start = old_stop - len(decode_lines(self.tail, self.encoding)[0])
+        # In place, so an append costs time proportional to its size
+        del self.lines[start:]
+        self.lines.extend(new_lines)
+        return start, old_stop, len(self.lines)
+
+    def _remember(self, st: os.stat_result, offset: int, data: bytes):
+        self.size = offset + len(data)
+        self.mtime_ns = st.st_mtime_ns
+        self.identity = (st.st_dev, st.st_ino)
+        # Start of the last line, found from the end so it is cheap after an append
+        tail_start = offset + data.rfind(b'\n', 0, max(len(data) - 1, 0)) + 1
+        # Extends the CRC of the bytes before offset, which were checked or just read
+        self.head_crc = zlib.crc32(memoryview(data)[:tail_start - offset], self.head_crc if offset else 0)
+        self.tail_start = tail_start
+        self.tail = data[tail_start - offset:]
+
+
+class WatchedPair:
+    """A file pair whose diff is kept up to date as the files change.
+
+    Files are polled by size and modification time. Growth is read from the
+    start of the previous last line when the file is still the same one and
+    the bytes before that line are unchanged (one CRC-32 pass); any other
+    change re-reads it. Either way DiffEngine.rediff() only diffs the
+    changed window, so a log growing by a few lines is only decoded and
+    diffed around those lines.
+    """
+
+    def __init__(self, engine: DiffEngine, file1: str, file2: str):
+        self.engine = engine
+        self.files = (_WatchedFile(file1), _WatchedFile(file2))
+        self.result: Optional[DiffResult] = None
+
+    def changed(self) -> bool:
+        """Whether either file changed since the last refresh()"""
+        return any(watched.changed() for watched in self.files)
+
+    def refresh(self) -> Optional[DiffResult]:
+        """Diff the pair if either file changed; returns the new result, or None if neither did"""
+        if self.result is None:
+            for watched in self.files:
+                watched.read()
+            self.result = self.engine.diff_lines(self.files[0].lines, self.files[1].lines)
+            return self.result
+        windows = []
+        for watched in self.files:
+            if watched.changed():
+                windows.append(watched.read())
+            else:
+                count = len(watched.lines)
+                windows.append((count, count, count))
+        if all(window is not None and window[0] == window[1] == window[2] for window in windows):
+            return None
+        self.result = self.engine.rediff(self.result, self.files[0].lines, self.files[1].lines, *windows)
+        return self.result
@@ -0,0 +1,33 @@
+import random
+
+import diff_engine
+from diff_engine import DiffEngine
+
+
+def repetitive_pair(count, seed=5):
+    """Lines from a small vocabulary, and a copy with about 10% of them edited"""
+    rng = random.Random(seed)
+    vocabulary = [f"key{k} = value" for k in range(20)] + ["", "{", "}"]
+    lines1 = [rng.choice(vocabulary) for _ in range(count)]
+    lines2 = []
+    kept = 0
+    for line in lines1:
+        roll = rng.random()
+        if roll < 0.05:
+            continue
+        if roll < 0.10:
+            lines2.append(rng.choice(vocabulary))
+        lines2.append(line)
+        kept += 1
+    return lines1, lines2, kept
+
+
+def test_dense_repetitive_input_keeps_unchanged_lines(monkeypatch):
+    # A small search limit makes every region dense enough to be split
+    monkeypatch.setattr(diff_engine, 'MYERS_MAX_D', 16)
+    lines1, lines2, kept = repetitive_pair(3000)
+    for algorithm in ('myers', 'patience', 'histogram'):
+        stats = DiffEngine(algorithm=algorithm).diff_lines(lines1, lines2).stats()
+        # Every line that was not deleted is still there, so at least that many are unchanged
+        assert stats['unchanged_lines'] >= kept, algorithm
+        assert stats['total_lines_left'] == len(lines1)
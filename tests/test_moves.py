@@ -0,0 +1,48 @@
+import random
+
+from diff_engine import ALGORITHMS, DiffEngine, DiffType
+
+
+def shuffled_blocks(rng):
+    """Random lines, then a copy with a few blocks moved and lines inserted"""
+    lines1 = [f"line {rng.randrange(30)}" for _ in range(rng.randrange(60))]
+    lines2 = list(lines1)
+    for _ in range(rng.randrange(1, 4)):
+        if len(lines2) > 4:
+            start = rng.randrange(len(lines2) - 3)
+            size = rng.randrange(3, min(8, len(lines2) - start) + 1)
+            block = lines2[start:start + size]
+            del lines2[start:start + size]
+            lines2[rng.randrange(len(lines2) + 1):0] = block
+        lines2.insert(rng.randrange(len(lines2) + 1), f"new {rng.randrange(5)}")
+    return lines1, lines2
+
+
+def test_moved_lines_are_never_paired():
+    moved = [f"moved {k}" for k in range(4)]
+    kept = [f"kept {k}" for k in range(6)]
+    engine = DiffEngine()
+    result = engine.diff_lines(moved + kept + ["old"], kept + ["new"] + moved)
+    # The move lands in the replace of "old"; only "old" and "new" stay paired
+    assert result.moves == [(0, 4, 7, 11)]
+    assert result.opcodes == [('delete', 0, 4, 0, 0), ('equal', 4, 10, 0, 6),
+                              ('replace', 10, 11, 6, 7), ('insert', 11, 11, 7, 11)]
+    stats = result.stats()
+    assert (stats['moved_lines'], stats['changed_lines'], stats['added_lines']) == (4, 1, 0)
+    assert engine.get_stats(result.left_diff, result.right_diff) == stats
+
+
+def test_stats_agree_with_moves():
+    rng = random.Random(1)
+    for _ in range(200):
+        lines1, lines2 = shuffled_blocks(rng)
+        for algorithm in ALGORITHMS:
+            engine = DiffEngine(algorithm=algorithm)
+            result = engine.diff_lines(lines1, lines2)
+            rows = list(result)
+            assert engine.get_stats([left for left, _ in rows], [right for _, right in rows]) == result.stats()
+            for left_line, right_line in rows:
+                if left_line.diff_type == DiffType.MOVE:
+                    assert right_line.line_num is None
+                if right_line.diff_type == DiffType.MOVE:
+                    assert left_line.line_num is None
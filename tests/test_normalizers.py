@@ -0,0 +1,15 @@
+from normalizers import Normalizer
+
+
+def test_masked_text_never_equals_a_literal_nul():
+    normalizer = Normalizer(masks=['number'])
+    assert normalizer('id 42') != normalizer('id \x00')
+    assert normalizer('id 42\x00') != normalizer('id \x00\x00')
+    assert normalizer('id 42\x00') == normalizer('id 7\x00')
+
+
+def test_apply_matches_per_line_keys():
+    lines = ['12 ab', 'cd 34', '', 'x\x00 5', 'ef 6']
+    for masks in (['number'], [r'\A\d+'], [r'\d+\Z'], [r'b(?=\n)'], [r'\d\s*'], ['^cd', 'guid']):
+        normalizer = Normalizer(ignore_case=True, masks=masks)
+        assert normalizer.apply(lines) == [normalizer(line) for line in lines], masks
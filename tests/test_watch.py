@@ -0,0 +1,143 @@
+import os
+import random
+
+from diff_engine import DiffEngine, _split_opcodes
+from watch import WatchedPair, _WatchedFile
+
+
+def check_opcodes(lines1, lines2, opcodes):
+    """Opcodes cover both sides in order and 'equal' ranges really are equal"""
+    i = j = 0
+    for tag, i1, i2, j1, j2 in opcodes:
+        assert (i1, j1) == (i, j)
+        if tag == 'equal':
+            assert lines1[i1:i2] == lines2[j1:j2]
+        i, j = i2, j2
+    assert (i, j) == (len(lines1), len(lines2))
+
+
+def write(path, data: bytes):
+    with open(path, 'wb') as f:
+        f.write(data)
+    # Make the change visible even where mtime has coarse resolution
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def test_append_is_read_as_window(tmp_path):
+    path = str(tmp_path / 'log')
+    write(path, b'one\ntwo\nthr')
+    watched = _WatchedFile(path)
+    assert watched.read() is None
+    lines = watched.lines
+    with open(path, 'ab') as f:
+        f.write(b'ee\nfour\n')
+    assert watched.changed()
+    assert watched.read() == (2, 3, 4)
+    assert watched.lines is lines
+    assert lines == ['one', 'two', 'three', 'four']
+
+
+def test_grown_rewrite_with_same_last_line_offset_is_reread(tmp_path):
+    path = str(tmp_path / 'log')
+    write(path, b'aaa\nbbb\nccc\n')
+    watched = _WatchedFile(path)
+    watched.read()
+    # The old last line sits at the old offset, but the lines before it changed
+    write(path, b'xxx\nyyy\nccc\nddd\n')
+    assert watched.read() is None
+    assert watched.lines == ['xxx', 'yyy', 'ccc', 'ddd']
+
+
+def test_replaced_file_is_reread(tmp_path):
+    path = str(tmp_path / 'log')
+    write(path, b'aaa\nbbb\n')
+    watched = _WatchedFile(path)
+    watched.read()
+    # Same leading bytes, but a new file (as editors save by renaming)
+    write(str(tmp_path / 'new'), b'aaa\nbbb\nccc\n')
+    os.replace(str(tmp_path / 'new'), path)
+    assert watched.read() is None
+    assert watched.lines == ['aaa', 'bbb', 'ccc']
+
+
+def test_watched_pair_matches_files_after_appends_and_rewrites(tmp_path):
+    rng = random.Random(7)
+    paths = [str(tmp_path / 'a'), str(tmp_path / 'b')]
+    contents = [b''.join(b'line %d\n' % rng.randrange(20) for _ in range(50)) for _ in paths]
+    for path, data in zip(paths, contents):
+        write(path, data)
+    pair = WatchedPair(DiffEngine(), *paths)
+    pair.refresh()
+    for _ in range(100):
+        side = rng.randrange(2)
+        data = contents[side]
+        if rng.random() < 0.6:
+            data += b''.join(b'line %d\n' % rng.randrange(20) for _ in range(rng.randrange(1, 5)))
+        else:
+            # Rewrite keeping the same length up to the last line, then grow
+            lines = data.split(b'\n')
+            k = rng.randrange(len(lines))
+            lines[k] = lines[k][::-1]
+            data = b'\n'.join(lines) + b'line x\n'
+        contents[side] = data
+        write(paths[side], data)
+        result = pair.refresh()
+        expected = [data.decode().splitlines() for data in contents]
+        assert [list(result.lines1), list(result.lines2)] == expected
+        check_opcodes(result.lines1, result.lines2, result.opcodes)
+
+
+def test_rediff_windows_give_valid_opcodes():
+    rng = random.Random(3)
+    engine = DiffEngine()
+    for _ in range(200):
+        lines1 = ['%d' % rng.randrange(10) for _ in range(rng.randrange(60))]
+        lines2 = list(lines1)
+        for _ in range(rng.randrange(5)):
+            lines2.insert(rng.randrange(len(lines2) + 1), 'x')
+        previous = engine.diff_lines(lines1, lines2)
+        new1 = list(lines1)
+        start = rng.randrange(len(new1) + 1)
+        stop = rng.randrange(start, len(new1) + 1)
+        new1[start:stop] = ['%d' % rng.randrange(10) for _ in range(rng.randrange(5))]
+        new_stop = stop + len(new1) - len(lines1)
+        for window1 in ((start, stop, new_stop), None):
+            result = engine.rediff(previous, new1, lines2, window1, None if window1 is None else
+                                   (len(lines2), len(lines2), len(lines2)))
+            check_opcodes(new1, lines2, result.opcodes)
+
+
+def test_rediff_without_changes_keeps_opcodes():
+    engine = DiffEngine()
+    lines1 = ['a', 'b', 'c', 'd']
+    lines2 = ['a', 'x', 'c', 'd', 'e']
+    previous = engine.diff_lines(lines1, lines2)
+    assert engine.rediff(previous, list(lines1), list(lines2)).opcodes == previous.opcodes
+
+
+def test_split_opcodes_cuts_on_equal_runs_outside_the_window():
+    rng = random.Random(5)
+    engine = DiffEngine()
+    for _ in range(300):
+        lines1 = ['%d' % rng.randrange(6) for _ in range(rng.randrange(40))]
+        lines2 = ['%d' % rng.randrange(6) for _ in range(rng.randrange(40))]
+        opcodes = engine.diff_lines(lines1, lines2).opcodes
+        start1 = rng.randrange(len(lines1) + 1)
+        start2 = rng.randrange(len(lines2) + 1)
+        stop1 = rng.randrange(start1, len(lines1) + 1)
+        stop2 = rng.randrange(start2, len(lines2) + 1)
+        head, tail = _split_opcodes(opcodes, start1, start2, stop1, stop2)
+        if head:
+            assert head[0][1:5:2] == (0, 0)
+            assert head[-1][0] == 'equal'
+            assert head[-1][2] <= start1 and head[-1][4] <= start2
+        if tail:
+            assert tail[-1][2:5:2] == (len(lines1), len(lines2))
+            assert tail[0][0] == 'equal'
+            assert tail[0][1] >= stop1 and tail[0][3] >= stop2
+        # Both pieces are runs of the original opcodes, trimmed only at their inner ends
+        for piece in (head, tail):
+            for tag, i1, i2, j1, j2 in piece:
+                if tag == 'equal':
+                    assert lines1[i1:i2] == lines2[j1:j2]
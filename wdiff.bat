@@ -3,5 +3,6 @@ REM Windows Diff Tool - Batch launcher
 REM Usage: wdiff.bat [options] file1 file2
 REM        wdiff.bat --gui
 
+set "USER_DIR=%CD%"
 cd /d "%~dp0"
-python src/main.py %*
+python src/main.py --user-dir "%USER_DIR%" %*